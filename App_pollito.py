@@ -1,12 +1,15 @@
+import hmac
 import streamlit as st
-import gspread
-from google.oauth2.service_account import Credentials
 import pandas as pd
-import numpy as np
 from datetime import datetime, date
-import plotly.graph_objects as go
-import plotly.express as px
-from io import StringIO
+from functools import partial
+from almacenamiento import AlmacenEspejo, AlmacenMemoria, AlmacenSheets, abrir_hoja_calculo
+from bandeja_salida import BandejaSalida
+from carga_datos import CacheHojas
+from exportacion import FORMATOS, csv_lote, exportar_zip, lotes_en_rango
+from metricas import CUOTA_POR_MINUTO, REGISTRO
+from puntuacion import calcular_puntuacion
+from tendencias import SIN_DATO, tendencia
 
 # --- CONFIGURACIÓN DE PÁGINA Y ESTILOS ---
 st.set_page_config(page_title="Método Rodriguez - Calidad de Pollito", layout="wide")
@@ -14,62 +17,85 @@ st.set_page_config(page_title="Método Rodriguez - Calidad de Pollito", layout="
 # --- CONEXIÓN A GOOGLE SHEETS ---
 @st.cache_resource
 def connect_to_google_sheets():
+    # gspread y google-auth se importan solo al conectar (no en cada arranque en modo memoria)
+    import gspread
+    from google.oauth2.service_account import Credentials
     try:
         creds_dict = st.secrets["gcp_service_account"]
         scopes = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
         credentials = Credentials.from_service_account_info(creds_dict, scopes=scopes)
-        client = gspread.authorize(credentials)
-        spreadsheet = client.open("BD_Calidad_Pollito")
+        client = REGISTRO.instrumentar(gspread.authorize(credentials))  # latencia, bytes y cuota de cada llamada
+        spreadsheet = abrir_hoja_calculo(client, leer_config_almacen())
         return spreadsheet
     except Exception as e:
         st.error(f"Error al conectar con Google Sheets: {e}")
         return None
 
-spreadsheet = connect_to_google_sheets()
+# --- ALMACENAMIENTO ---
+# Configurable en secrets.toml, sección [almacen]:
+#   tipo = "espejo" (por defecto): lecturas desde una réplica SQLite local, Sheets como sistema de registro
+#   tipo = "sheets": lecturas y escrituras directas a Google Sheets
+#   tipo = "memoria": hojas en memoria, sin conexión (pruebas y demostraciones)
+#   ruta_espejo: archivo SQLite de la réplica local con tipo = "espejo" (por defecto espejo_pollito.sqlite)
+#   ruta_bandeja: archivo SQLite de la bandeja de salida (por defecto bandeja_pollito.sqlite)
+#   clave_hoja: clave de BD_Calidad_Pollito (la parte /d/<clave>/ de su URL); sin ella se busca por nombre en Drive
+#   admin: clave del Panel de Rendimiento; solo se ofrece al abrir la app con ?admin=<clave> (sin ella, a nadie)
+def leer_config_almacen():
+    try:
+        return dict(st.secrets.get("almacen", {}))
+    except Exception:
+        return {}
+
+@st.cache_resource
+def obtener_almacen():
+    config = leer_config_almacen()
+    tipo = config.get("tipo", "espejo")
+    if tipo == "memoria":
+        return AlmacenMemoria()
+    spreadsheet = connect_to_google_sheets()
+    if not spreadsheet:
+        return None
+    if tipo == "sheets":
+        return AlmacenSheets(spreadsheet)
+    return AlmacenEspejo(AlmacenSheets(spreadsheet), config.get("ruta_espejo", "espejo_pollito.sqlite"))
 
 # --- CARGA Y LIMPIEZA DE DATOS ---
-@st.cache_data(ttl=300)
-def load_all_data(_spreadsheet):
-    if not _spreadsheet:
-        return (None,) * 8
+# Una sola caché por proceso, compartida por todas las sesiones; se refresca de forma incremental
+@st.cache_resource
+def obtener_cache_hojas(_almacen):
+    return CacheHojas(_almacen, ttl=300)
+
+# Devuelve un IndiceLotes: los DataFrames, sus posiciones por lote_id y los agregados por lote
+def cargar_indice(_almacen, forzar=False):
+    if not _almacen:
+        return None
     try:
-        df_names = {
-            "huevo_recepcion": "Huevo_Recepcion", "lotes_resumen": "Lotes_Resumen",
-            "pollitos_detalle": "Pollitos_Detalle", "transporte": "Transporte_Evaluacion",
-            "granja_resumen": "Granja_Evaluacion", "granja_detalle": "Granja_Detalle_Calidad",
-            "seguimiento_resumen": "Seguimiento_7_Dias_Resumen", "seguimiento_detalle": "Seguimiento_7_Dias_Detalle"
-        }
-        dataframes = {}
-        for df_key, sheet_name in df_names.items():
-            try:
-                worksheet = _spreadsheet.worksheet(sheet_name)
-                values = worksheet.get_all_values()
-                headers = values.pop(0) if values else []
-                dataframes[df_key] = pd.DataFrame(values, columns=headers)
-            except gspread.exceptions.WorksheetNotFound:
-                dataframes[df_key] = pd.DataFrame()
-
-        # SOLUCIÓN: Normalizar IDs ANTES de la conversión numérica
-        for df in dataframes.values():
-            if not df.empty:
-                # Primero, normalizar todas las posibles columnas de ID a string limpio
-                id_cols = [col for col in ['id_lote_huevo', 'lote_id'] if col in df.columns]
-                for id_col in id_cols:
-                    df[id_col] = df[id_col].astype(str).str.strip()
-                
-                # Segundo, convertir las columnas numéricas, EXCLUYENDO las de ID
-                for col in df.columns:
-                    if (df[col].dtype == 'object' and 
-                        '_ok' not in col and 
-                        'fecha' not in col and 
-                        'hora' not in col and
-                        col not in ['id_lote_huevo', 'lote_id']): # Exclusión explícita
-                        df[col] = pd.to_numeric(df[col].astype(str).str.replace(',', '.'), errors='coerce')
-        
-        return tuple(dataframes.values())
+        cache = obtener_cache_hojas(_almacen)
+        return cache.refrescar() if forzar else cache.obtener()
     except Exception as e:
         st.error(f"Ocurrió un error al cargar los datos: {e}")
-        return (None,) * 8
+        return None
+
+# Los formularios encolan en una bandeja local durable; un hilo la vacía hacia el almacén
+@st.cache_resource
+def obtener_bandeja(_almacen):
+    config = leer_config_almacen()
+    ruta = ":memory:" if config.get("tipo") == "memoria" else config.get("ruta_bandeja", "bandeja_pollito.sqlite")
+    # Tras cada escritura se refresca la caché compartida en segundo plano (incremental, sin vaciarla)
+    return BandejaSalida(_almacen, ruta, al_escribir=obtener_cache_hojas(_almacen).refrescar_en_segundo_plano).iniciar()
+
+almacen = obtener_almacen()
+bandeja = obtener_bandeja(almacen) if almacen else None
+
+# Consulta puntual de un lote: no recarga las 8 hojas ni vacía la caché de las demás sesiones.
+# Incluye las filas aún en la bandeja de salida, para poder evaluar un lote recién registrado.
+def buscar_lote(lote_id, claves):
+    try:
+        pendientes = bandeja.filas_pendientes if bandeja else None
+        return obtener_cache_hojas(almacen).buscar_lote(lote_id, claves, pendientes=pendientes)
+    except Exception as e:
+        st.error(f"Ocurrió un error al buscar el lote: {e}")
+        return {clave: pd.DataFrame() for clave in claves}
 
 # --- INICIALIZACIÓN DEL ESTADO DE SESIÓN ---
 def initialize_session_state():
@@ -89,8 +115,20 @@ initialize_session_state()
 st.sidebar.image("pollito_logo_al.jpg", caption="Calidad desde el Origen")
 st.sidebar.markdown("---")
 st.sidebar.subheader("Instrucciones de Uso")
-st.sidebar.info("Navegue por cada pestaña para registrar y analizar los datos de calidad del lote.")
+st.sidebar.info("Navegue por cada paso (menú superior) para registrar y analizar los datos de calidad del lote.")
+if bandeja and bandeja.pendientes():
+    st.sidebar.warning(f"⏳ {bandeja.pendientes()} evaluación(es) guardada(s) localmente, pendientes de sincronizar con Google Sheets.")
+    if bandeja.ultimo_error: st.sidebar.caption(f"Último error de sincronización: {bandeja.ultimo_error}")
+detenidos = bandeja.detenidos() if bandeja else {}
+if detenidos:
+    st.sidebar.error(f"⛔ {len(detenidos)} evaluación(es) rechazada(s) por Google Sheets; no se reintentarán solas.")
+    for error in sorted(set(detenidos.values())): st.sidebar.caption(error)
+    if st.sidebar.button("🔁 Reintentar rechazadas"): bandeja.reactivar(); st.rerun()
 st.sidebar.markdown("---")
+# El parámetro ?admin= se pierde al cambiar de paso, así que se recuerda en la sesión
+clave_admin = str(leer_config_almacen().get("admin", ""))
+if clave_admin and hmac.compare_digest(st.query_params.get("admin", ""), clave_admin): st.session_state.es_admin = True
+panel_rendimiento = st.session_state.get("es_admin", False) and st.sidebar.toggle("📊 Panel de Rendimiento", False, help="Tiempos de las llamadas a Google Sheets, de la caché y del render de cada paso.")
 st.sidebar.caption(
     """
     **Nota de Responsabilidad:** Herramienta de apoyo. Su uso es de exclusiva responsabilidad del usuario y no sustituye la asesoría profesional. Albateq S.A. no se hace responsable por las decisiones tomadas.
@@ -107,39 +145,17 @@ with col_logo:
 
 st.markdown("---")
 
-tab_names = ["Paso 0: Recepción Huevo", "Paso 1: Incubadora", "Paso 2: Transporte", "Paso 3: Granja (Recepción)", "Paso 4: Evaluación 7 Días", "Paso 5: Dashboard de Análisis"]
-tabs = st.tabs(tab_names)
-
 # --- LÓGICA DE CÁLCULO Y FORMATO ---
-def calcular_puntuacion(df, sample_size):
-    puntuaciones = {'vitalidad_ok': 15, 'ombligo_ok': 15, 'patas_ok': 9.5, 'ojos_ok': 9.5, 'pico_ok': 7.125, 'abdomen_ok': 7.125, 'plumon_ok': 7.125, 'cuello_ok': 7.125}
-    peso_col = next((col for col in ['peso_gr', 'peso_granja_gr', 'peso_7d_gr'] if col in df.columns), None)
-    if not peso_col: return 0, 0
-    
-    for col in puntuaciones.keys():
-        if col in df.columns:
-            df[col] = df[col].apply(lambda x: str(x).strip().upper() == 'TRUE')
-
-    df['puntuacion_individual'] = sum(df[param] * (score / sample_size) for param, score in puntuaciones.items() if param in df.columns)
-    df['puntuacion_individual'] += np.where(df[peso_col] >= 34, 9.5 / sample_size, 0)
-    puntuacion_final = df['puntuacion_individual'].sum()
-    
-    peso_promedio = df[peso_col].mean()
-    uniformidad = (df[peso_col].between(peso_promedio * 0.9, peso_promedio * 1.1).sum() / sample_size) * 100
-    if uniformidad >= 82:
-        puntuacion_final += 13
-    return puntuacion_final, uniformidad
-
 def get_score_rating(score):
     if score > 95: return "Excelente", "green"
     if score > 85: return "Bueno", "blue"
     return "Alerta", "red"
 
-# --- PESTAÑAS ---
-with tabs[0]: # Paso 0
+# --- PASOS (una página cada uno; solo se ejecuta la activa) ---
+def paso_0(): # Paso 0
     with st.form("huevo_form"):
         h_col1, h_col2, h_col3 = st.columns(3)
-        with h_col1: lote_id_huevo = st.text_input("ID Lote de Huevo").strip(); granja_origen_huevo = st.text_input("Granja de Origen del Huevo"); edad_reproductoras = st.number_input("Edad Lote Reproductoras (semanas)", 20, 80, 40)
+        with h_col1: lote_id_huevo = st.text_input("ID Lote de Huevo", help="Use el mismo ID que tendrá el lote de pollitos en el Paso 1: así se vincula la edad de reproductoras en Tendencias entre Lotes.").strip(); granja_origen_huevo = st.text_input("Granja de Origen del Huevo"); edad_reproductoras = st.number_input("Edad Lote Reproductoras (semanas)", 20, 80, 40)
         with h_col2: fecha_recepcion_huevo = st.date_input("Fecha de Recepción"); temp_camion = st.slider("Temperatura del Camión (°C)", 15.0, 25.0, 18.0); tiempo_espera = st.number_input("Tiempo de Espera Descarga (min)", 0, value=15)
         with h_col3: st.write("**Evaluación Física (Muestra)**"); huevos_sucios = st.number_input("N° Huevos Sucios", 0, step=1); huevos_fisurados = st.number_input("N° Huevos Fisurados", 0, step=1); total_muestra = st.number_input("Total Huevos Muestra", 30, value=100, step=10)
         st.markdown("---"); st.subheader("Análisis de Peso (30 Huevos)")
@@ -150,10 +166,10 @@ with tabs[0]: # Paso 0
                 with st.spinner("Guardando..."):
                     df_huevo = edited_huevo_df; porc_sucios = (huevos_sucios / total_muestra) * 100 if total_muestra > 0 else 0; porc_fisurados = (huevos_fisurados / total_muestra) * 100 if total_muestra > 0 else 0; peso_promedio = df_huevo['peso_huevo_gr'].mean(); cv_peso = (df_huevo['peso_huevo_gr'].std() / peso_promedio) * 100 if peso_promedio > 0 else 0
                     huevo_data_row = [lote_id_huevo, granja_origen_huevo, int(edad_reproductoras), str(fecha_recepcion_huevo), float(temp_camion), int(tiempo_espera), round(porc_sucios, 2), round(porc_fisurados, 2), round(peso_promedio, 2), round(cv_peso, 2)]
-                    try: spreadsheet.worksheet("Huevo_Recepcion").append_row(huevo_data_row); st.success(f"Evaluación del lote de huevo {lote_id_huevo} guardada.")
+                    try: bandeja.encolar([("Huevo_Recepcion", [huevo_data_row])]); st.success(f"Evaluación del lote de huevo {lote_id_huevo} guardada.")
                     except Exception as e: st.error(f"Error al guardar: {e}")
 
-with tabs[1]: # Paso 1
+def paso_1(): # Paso 1
     with st.form("info_lote_form"):
         col1, col2, col3 = st.columns(3)
         with col1: lote_id = st.text_input("ID del Lote").strip(); granja_origen = st.text_input("Granja de Origen"); linea_genetica = st.selectbox("Línea Genética", ["Cobb", "Ross", "Otra"])
@@ -165,15 +181,15 @@ with tabs[1]: # Paso 1
             if not lote_id or not granja_origen or not evaluador: st.error("ID del Lote, Granja de Origen y Evaluador son obligatorios.")
             else:
                 with st.spinner("Guardando..."):
-                    puntuacion_final, uniformidad = calcular_puntuacion(edited_df.copy(), 30)
+                    with REGISTRO.medir('calculo', 'calcular_puntuacion'): puntuacion_final, uniformidad = calcular_puntuacion(edited_df.copy(), 30)
                     temp_cloacal_promedio = edited_df['temp_cloacal'].mean(); cv_peso = (edited_df['peso_gr'].std() / edited_df['peso_gr'].mean()) * 100 if edited_df['peso_gr'].mean() > 0 else 0
                     resumen_data = [lote_id, granja_origen, linea_genetica, str(fecha_nacimiento), int(cantidad_total), evaluador, float(temp_furgon), float(temp_cascara), float(temp_salon), bool(huevo_sudado), int(aves_por_caja), round(temp_cloacal_promedio, 2), round(puntuacion_final, 2), round(uniformidad, 2), round(cv_peso, 2)]
                     df_detalle = edited_df.copy(); df_detalle.insert(0, 'lote_id', lote_id)
                     for col in df_detalle.select_dtypes(include=['bool']).columns: df_detalle[col] = df_detalle[col].astype(str).str.upper()
-                    try: spreadsheet.worksheet("Lotes_Resumen").append_row(resumen_data); spreadsheet.worksheet("Pollitos_Detalle").append_rows(df_detalle.values.tolist()); st.success(f"Evaluación de incubadora del lote {lote_id} guardada.")
+                    try: bandeja.encolar([("Lotes_Resumen", [resumen_data]), ("Pollitos_Detalle", df_detalle.values.tolist())]); st.success(f"Evaluación de incubadora del lote {lote_id} guardada.")
                     except Exception as e: st.error(f"Error al guardar: {e}")
 
-with tabs[2]: # Paso 2
+def paso_2(): # Paso 2
     with st.form("transporte_form"):
         t_col1, t_col2, t_col3 = st.columns(3)
         with t_col1: lote_id_transporte = st.text_input("ID del Lote").strip(); fecha_transporte = st.date_input("Fecha"); placa_vehiculo = st.text_input("Placa Vehículo"); conductor = st.text_input("Conductor")
@@ -184,10 +200,10 @@ with tabs[2]: # Paso 2
             else:
                 duracion = (datetime.combine(date.today(), hora_llegada) - datetime.combine(date.today(), hora_salida)).total_seconds() / 60
                 transporte_data = [lote_id_transporte, str(fecha_transporte), placa_vehiculo, conductor, str(hora_salida), str(hora_llegada), int(duracion), float(temp_inicio), int(hum_inicio), float(temp_final), int(hum_final), comportamiento_llegada, int(mortalidad_transporte)]
-                try: spreadsheet.worksheet("Transporte_Evaluacion").append_row(transporte_data); st.success(f"Evaluación de transporte del lote {lote_id_transporte} guardada.")
+                try: bandeja.encolar([("Transporte_Evaluacion", [transporte_data])]); st.success(f"Evaluación de transporte del lote {lote_id_transporte} guardada.")
                 except Exception as e: st.error(f"Error al guardar: {e}")
 
-with tabs[3]: # Paso 3
+def paso_3(): # Paso 3
     with st.form("granja_form"):
         g_col1, g_col2 = st.columns(2)
         with g_col1: lote_id_granja = st.text_input("ID del Lote").strip(); fecha_recepcion = st.date_input("Fecha Recepción"); evaluador_granja = st.text_input("Evaluador en Granja")
@@ -202,18 +218,17 @@ with tabs[3]: # Paso 3
             if not lote_id_granja: st.error("El 'ID del Lote' es obligatorio.")
             else:
                 with st.spinner("Guardando..."):
-                    puntuacion_final_granja, _ = calcular_puntuacion(edited_granja_df.copy(), 30)
+                    with REGISTRO.medir('calculo', 'calcular_puntuacion'): puntuacion_final_granja, _ = calcular_puntuacion(edited_granja_df.copy(), 30)
                     cv_temp = (edited_granja_df['temp_cloacal_granja_c'].std() / edited_granja_df['temp_cloacal_granja_c'].mean()) * 100 if edited_granja_df['temp_cloacal_granja_c'].mean() > 0 else 0
                     cv_peso_granja = (edited_granja_df['peso_granja_gr'].std() / edited_granja_df['peso_granja_gr'].mean()) * 100 if edited_granja_df['peso_granja_gr'].mean() > 0 else 0
                     buche_lleno_pct = (llenos_buche_24h_n / muestra_buche_n) * 100 if muestra_buche_n > 0 else 0
                     resumen_granja_data = [lote_id_granja, str(fecha_recepcion), evaluador_granja, float(temp_ambiente_c), int(hum_relativa_pct), float(temp_cama_c), round(buche_lleno_pct, 2), round(cv_temp, 2), round(cv_peso_granja, 2), round(puntuacion_final_granja, 2)]
                     df_granja_detalle = edited_granja_df.copy(); df_granja_detalle.insert(0, 'lote_id', lote_id_granja)
                     for col in df_granja_detalle.select_dtypes(include=['bool']).columns: df_granja_detalle[col] = df_granja_detalle[col].astype(str).str.upper()
-                    try: spreadsheet.worksheet("Granja_Evaluacion").append_row(resumen_granja_data); spreadsheet.worksheet("Granja_Detalle_Calidad").append_rows(df_granja_detalle.values.tolist()); st.success(f"Evaluación de recepción del lote {lote_id_granja} guardada.")
+                    try: bandeja.encolar([("Granja_Evaluacion", [resumen_granja_data]), ("Granja_Detalle_Calidad", df_granja_detalle.values.tolist())]); st.success(f"Evaluación de recepción del lote {lote_id_granja} guardada.")
                     except Exception as e: st.error(f"Error al guardar: {e}")
 
-with tabs[4]: # Paso 4
-    debug_mode = st.checkbox("🔍 Modo Debug", value=False)
+def paso_4(): # Paso 4
     with st.form("seguimiento_form"):
         s_col1, s_col2 = st.columns(2)
         with s_col1: lote_id_seg = st.text_input("ID del Lote").strip(); fecha_eval_7d = st.date_input("Fecha de Evaluación (Día 7)")
@@ -224,28 +239,13 @@ with tabs[4]: # Paso 4
             if not lote_id_seg: st.error("El ID del Lote es obligatorio.")
             else:
                 with st.spinner("Guardando..."):
-                    st.cache_data.clear()
-                    h, lotes, p, t, granja, granja_det, sr, sd = load_all_data(spreadsheet)
-                    
-                    if debug_mode:
-                        st.write("### 🔍 Información de Debug")
-                        st.write(f"**ID buscado:** `{lote_id_seg}` (Tipo: {type(lote_id_seg)})")
-                        if lotes is not None and not lotes.empty:
-                            st.write("**IDs disponibles en Lotes_Resumen:**", lotes['lote_id'].unique())
-                            st.write(f"**Tipo de columna lote_id:** {lotes['lote_id'].dtype}")
-                        else: st.error("⚠️ DataFrame 'lotes' está vacío o es None")
-
-                    lote_info_df = lotes[lotes['lote_id'] == lote_id_seg] if lotes is not None and not lotes.empty else pd.DataFrame()
+                    encontrados = buscar_lote(lote_id_seg, ["lotes_resumen", "granja_detalle"])
+                    lote_info_df, granja_detalle_info = encontrados["lotes_resumen"], encontrados["granja_detalle"]
                     
                     if lote_info_df.empty:
                         st.error(f"Error: No se encontró el ID de Lote '{lote_id_seg}' en la hoja 'Lotes_Resumen'. Verifique que el ID sea correcto y que ya exista una evaluación de incubadora para este lote.")
-                        if debug_mode and lotes is not None:
-                            st.write("**Comparación exacta:**")
-                            for id_val in lotes['lote_id'].unique()[:5]:
-                                st.write(f"- DB: `{id_val}` ({type(id_val)}) | Buscado: `{lote_id_seg}` ({type(lote_id_seg)}) | Match: {id_val == lote_id_seg}")
                     else:
                         lote_info = lote_info_df.iloc[0]
-                        granja_detalle_info = granja_det[granja_det['lote_id'] == lote_id_seg] if granja_det is not None and not granja_det.empty else pd.DataFrame()
                         df_seg = edited_seg_df.copy()
                         peso_promedio_7d = df_seg['peso_7d_gr'].mean()
                         cv_peso_7d = (df_seg['peso_7d_gr'].std() / peso_promedio_7d) * 100 if peso_promedio_7d > 0 else 0
@@ -260,74 +260,133 @@ with tabs[4]: # Paso 4
                         for col in df_seg_detalle.select_dtypes(include=['bool']).columns: df_seg_detalle[col] = df_seg_detalle[col].astype(str).str.upper()
                         
                         try:
-                            spreadsheet.worksheet("Seguimiento_7_Dias_Resumen").append_row(resumen_data)
-                            spreadsheet.worksheet("Seguimiento_7_Dias_Detalle").append_rows(df_seg_detalle.values.tolist())
+                            bandeja.encolar([("Seguimiento_7_Dias_Resumen", [resumen_data]), ("Seguimiento_7_Dias_Detalle", df_seg_detalle.values.tolist())])
                             st.success(f"Evaluación de 7 días para el lote {lote_id_seg} guardada.")
                         except Exception as e:
-                            st.error(f"Error al guardar en Google Sheets: {e}")
+                            st.error(f"Error al guardar: {e}")
 
-with tabs[5]: # Paso 5
+def paso_5(): # Paso 5
+    import plotly.express as px
     st.header("Dashboard de Análisis de Lotes")
     if st.button('Refrescar Datos'):
-        st.cache_data.clear(); st.rerun()
+        cargar_indice(almacen, forzar=True); st.rerun()
     
-    huevo, lotes, pollitos, transp, granja, granja_det, seguim_res, seguim_det = load_all_data(spreadsheet)
+    indice = cargar_indice(almacen)
 
-    if lotes is not None and not lotes.empty:
-        lote_seleccionado = st.selectbox("Selecciona un Lote para Analizar", options=sorted(lotes['lote_id'].unique(), reverse=True))
+    if indice is not None and indice.lotes():
+        lote_seleccionado = st.selectbox("Selecciona un Lote para Analizar", options=indice.lotes())
         if lote_seleccionado:
-            lote_data_df = lotes[lotes['lote_id'] == lote_seleccionado]
-            if lote_data_df.empty:
+            agregado = indice.agregado(lote_seleccionado)
+            if agregado is None:
                  st.warning(f"No se encontró información para el lote {lote_seleccionado}.")
                  st.stop()
-            lote_data = lote_data_df.iloc[0]
             
             kpi_col, dl_col = st.columns([4, 1])
             with kpi_col: kpi1, kpi2, kpi3, kpi4, kpi5 = st.columns(5)
             
-            p_inc = lote_data.get('puntuacion_final', 0); rating, r_color = get_score_rating(p_inc); kpi1.markdown(f"**Calidad Incubadora** <h3 style='color:{r_color};'>{p_inc:.1f}</h3>", unsafe_allow_html=True)
+            p_inc = agregado['puntuacion_final']; rating, r_color = get_score_rating(p_inc); kpi1.markdown(f"**Calidad Incubadora** <h3 style='color:{r_color};'>{p_inc:.1f}</h3>", unsafe_allow_html=True)
             
-            granja_data = granja[granja['lote_id'] == lote_seleccionado] if granja is not None else pd.DataFrame()
-            if not granja_data.empty:
-                p_gra = granja_data.iloc[0].get('puntuacion_final_granja', 0); rating, r_color = get_score_rating(p_gra); caida_calidad = ((p_inc - p_gra) / p_inc) * 100 if p_inc > 0 else 0
-                kpi2.metric("Calidad Granja", f"{p_gra:.1f}", delta=f"{-caida_calidad:.1f}%", delta_color="inverse")
-                kpi3.metric("% Buche Lleno", f"{granja_data.iloc[0].get('buche_lleno_24h_pct', 0):.1f}%")
+            if agregado['tiene_granja']:
+                p_gra = agregado['puntuacion_final_granja']; rating, r_color = get_score_rating(p_gra)
+                kpi2.metric("Calidad Granja", f"{p_gra:.1f}", delta=f"{-agregado['caida_calidad_pct']:.1f}%", delta_color="inverse")
+                kpi3.metric("% Buche Lleno", f"{agregado['buche_lleno_24h_pct']:.1f}%")
 
-            seg_data = seguim_res[seguim_res['lote_id'] == lote_seleccionado] if seguim_res is not None else pd.DataFrame()
-            if not seg_data.empty: kpi4.metric("Mortalidad 7d", f"{seg_data.iloc[0].get('mortalidad_acumulada_7d_pct', 0):.2f}%")
+            if agregado['tiene_seguimiento']: kpi4.metric("Mortalidad 7d", f"{agregado['mortalidad_acumulada_7d_pct']:.2f}%")
 
-            p_inc_w = pollitos[pollitos['lote_id'] == lote_seleccionado]['peso_gr'].mean() if pollitos is not None and not pollitos.empty else 0
-            p_gra_w = granja_det[granja_det['lote_id'] == lote_seleccionado]['peso_granja_gr'].mean() if granja_det is not None and not granja_det.empty else 0
-            if p_inc_w > 0 and p_gra_w > 0: kpi5.metric("Merma Peso", f"{((p_inc_w - p_gra_w) / p_inc_w) * 100:.2f}%")
+            p_inc_w = agregado['peso_incubadora_gr']; p_gra_w = agregado['peso_granja_gr']
+            if pd.notna(agregado['merma_peso_pct']): kpi5.metric("Merma Peso", f"{agregado['merma_peso_pct']:.2f}%")
 
             with dl_col:
                 st.write(""); st.write("")
-                all_dfs = {'lote_resumen': lotes, 'pollitos_incubadora': pollitos, 'transporte': transp, 'granja_resumen': granja, 'pollitos_granja': granja_det, 'seguimiento_resumen': seguim_res, 'seguimiento_detalle': seguim_det}
-                output = StringIO()
-                for name, df in all_dfs.items():
-                    if df is not None and not df.empty:
-                        id_col_name = next((col for col in ['id_lote_huevo', 'lote_id'] if col in df.columns), None)
-                        if id_col_name:
-                            df_lote = df[df[id_col_name] == lote_seleccionado]
-                            if not df_lote.empty:
-                                output.write(f"--- {name.upper()} ---\n")
-                                df_lote.to_csv(output, index=False)
-                                output.write("\n\n")
-                st.download_button("📥 Descargar CSV", output.getvalue(), f"analisis_lote_{lote_seleccionado}.csv", "text/csv")
+                # El CSV se genera al pulsar el botón, no en cada recarga del dashboard
+                st.download_button("📥 Descargar CSV", partial(csv_lote, indice, lote_seleccionado), f"analisis_lote_{lote_seleccionado}.csv", "text/csv")
 
 
             st.markdown("---")
             st.subheader("Evolución de Uniformidad (CV%) y Peso Promedio")
             
-            cv_data = {'Incubadora': lote_data.get('cv_peso', 0), 'Granja': granja_data.iloc[0].get('cv_peso_granja_pct', 0) if not granja_data.empty else 0, 'Día 7': seg_data.iloc[0].get('cv_peso_7d_pct', 0) if not seg_data.empty else 0}
+            cv_data = {'Incubadora': agregado['cv_peso'], 'Granja': agregado['cv_peso_granja_pct'] if agregado['tiene_granja'] else 0, 'Día 7': agregado['cv_peso_7d_pct'] if agregado['tiene_seguimiento'] else 0}
             df_cv = pd.DataFrame([cv_data]).T.reset_index(); df_cv.columns = ['Fase', 'CV%']
             
-            peso_data = {'Incubadora': p_inc_w, 'Granja': p_gra_w, 'Día 7': seg_data.iloc[0].get('peso_promedio_7d', 0) if not seg_data.empty else 0}
+            peso_data = {'Incubadora': p_inc_w, 'Granja': p_gra_w, 'Día 7': agregado['peso_promedio_7d'] if agregado['tiene_seguimiento'] else 0}
             df_peso = pd.DataFrame([peso_data]).T.reset_index(); df_peso.columns = ['Fase', 'Peso Promedio (gr)']
 
             plot_col1, plot_col2 = st.columns(2)
             with plot_col1: st.plotly_chart(px.bar(df_cv, x='Fase', y='CV%', title="Evolución del Coeficiente de Variación del Peso", text_auto='.2f'), use_container_width=True)
             with plot_col2: st.plotly_chart(px.bar(df_peso, x='Fase', y='Peso Promedio (gr)', title="Evolución del Peso Promedio", text_auto='.2f'), use_container_width=True)
+
+        st.markdown("---")
+        with st.expander("📦 Exportación masiva"):
+            alcance = st.radio("Lotes a exportar", ["Lote seleccionado", "Todos los lotes", "Rango de fechas de nacimiento"], horizontal=True)
+            formato = st.radio("Formato", list(FORMATOS), format_func=FORMATOS.get, horizontal=True)
+            if alcance == "Lote seleccionado": lotes_export, sufijo = [lote_seleccionado], f"lote_{lote_seleccionado}"
+            elif alcance == "Todos los lotes": lotes_export, sufijo = None, "todos"
+            else:
+                rango = st.date_input("Nacidos entre", value=(date.today().replace(day=1), date.today()))
+                desde, hasta = (rango + (rango[0],))[:2] if isinstance(rango, tuple) and rango else (None, None)
+                lotes_export, sufijo = lotes_en_rango(indice, desde, hasta), f"{desde}_{hasta}"
+                st.caption(f"{len(lotes_export)} lote(s) en el rango.")
+            # El ZIP se escribe por bloques al pulsar el botón; nada se prepara en las recargas
+            st.download_button("📦 Descargar ZIP", partial(exportar_zip, indice, lotes_export, formato), f"pollito_{sufijo}_{formato}.zip", "application/zip",
+                               disabled=lotes_export == [])
     else:
         st.info("Aún no hay datos para mostrar.")
 
+def tendencias_lotes(): # Tendencias entre lotes
+    import plotly.express as px
+    st.header("Tendencias entre Lotes")
+    indice = cargar_indice(almacen)
+
+    if indice is not None and not indice.tendencias.empty:
+        desgloses = {"Sin desglose": None, "Granja de Origen": 'granja_origen', "Línea Genética": 'linea_genetica', "Edad Reproductoras": 'rango_edad'}
+        dimensiones = indice.tendencias.index.to_frame(index=False)
+        f_col1, f_col2, f_col3 = st.columns(3)
+        with f_col1: desglose = desgloses[st.selectbox("Desglosar por", list(desgloses))]
+        with f_col2: granjas_sel = st.multiselect("Granjas de Origen", sorted(dimensiones['granja_origen'].unique()))
+        with f_col3: lineas_sel = st.multiselect("Líneas Genéticas", sorted(dimensiones['linea_genetica'].unique()))
+
+        df_tend = tendencia(indice.tendencias, desglose, {'granja_origen': granjas_sel, 'linea_genetica': lineas_sel})
+        st.caption(f"{int(df_tend['n_lotes'].sum()) if not df_tend.empty else 0} lotes agrupados por semana de nacimiento.")
+        if desglose == 'rango_edad':
+            sin_edad = int(df_tend.loc[df_tend['rango_edad'] == SIN_DATO, 'n_lotes'].sum()) if not df_tend.empty else 0
+            st.caption(f"La edad de reproductoras se toma del Paso 0 registrado con el mismo ID que el lote de pollitos; {sin_edad} lote(s) sin ese registro aparecen como '{SIN_DATO}'.")
+        graficos = {'calidad_incubadora': "Calidad Incubadora", 'calidad_granja': "Calidad Granja", 'cv_peso_incubadora_pct': "CV% Peso (Incubadora)", 'mortalidad_7d_pct': "Mortalidad 7d (%)"}
+        plot_cols = st.columns(2)
+        for i, (medida, titulo) in enumerate(graficos.items()):
+            with plot_cols[i % 2]: st.plotly_chart(px.line(df_tend, x='semana', y=medida, color=desglose, markers=True, title=titulo, labels={'semana': 'Semana', medida: titulo}), width="stretch")
+    else:
+        st.info("Aún no hay datos para mostrar.")
+
+# --- NAVEGACIÓN ---
+pagina = st.navigation([
+    st.Page(paso_0, title="Paso 0: Recepción Huevo", default=True), st.Page(paso_1, title="Paso 1: Incubadora"),
+    st.Page(paso_2, title="Paso 2: Transporte"), st.Page(paso_3, title="Paso 3: Granja (Recepción)"),
+    st.Page(paso_4, title="Paso 4: Evaluación 7 Días"), st.Page(paso_5, title="Paso 5: Dashboard de Análisis"),
+    st.Page(tendencias_lotes, title="Tendencias entre Lotes"),
+], position="top")
+with REGISTRO.medir('render', pagina.title): pagina.run()
+
+# --- PANEL DE RENDIMIENTO ---
+# Se dibuja al final para incluir el render del paso de esta ejecución
+def mostrar_panel_rendimiento():
+    import plotly.express as px
+    st.markdown("---"); st.header("📊 Panel de Rendimiento")
+    cuota = REGISTRO.cuota_ultimo_minuto(); cache = REGISTRO.aciertos_cache()
+    consultas = cache.get('acierto', 0) + cache.get('vencido', 0) + cache.get('fallo', 0)
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("Lecturas Sheets (último min)", f"{cuota['lectura']} / {CUOTA_POR_MINUTO['lectura']}")
+    m2.metric("Escrituras Sheets (último min)", f"{cuota['escritura']} / {CUOTA_POR_MINUTO['escritura']}")
+    m3.metric("Aciertos de Caché", f"{cache.get('acierto', 0) / consultas * 100:.0f}%" if consultas else "—", help=f"Vencidos: {cache.get('vencido', 0)} · Fallos: {cache.get('fallo', 0)}")
+    m4.metric("Envíos Pendientes", bandeja.pendientes() if bandeja else 0)
+    resumen = REGISTRO.resumen()
+    if resumen.empty: st.info("Aún no hay mediciones."); return
+    st.subheader("Resumen por Operación"); st.dataframe(resumen, width="stretch")
+    st.subheader("Render por Paso (ms)")
+    if 'render' in resumen.index: st.plotly_chart(px.bar(resumen.loc['render'].reset_index(), x='nombre', y=['ms_promedio', 'ms_p95'], barmode='group', labels={'nombre': 'Paso', 'value': 'ms'}), width="stretch")
+    with st.expander("Eventos recientes"): st.dataframe(pd.DataFrame(list(REGISTRO.eventos)[-200:][::-1]), width="stretch")
+    r_col1, r_col2 = st.columns([1, 4])
+    with r_col1: st.download_button("📥 Descargar Registro (JSONL)", REGISTRO.a_jsonl, f"metricas_pollito_{datetime.now():%Y%m%d_%H%M%S}.jsonl", "application/x-ndjson")
+    with r_col2:
+        if st.button("Reiniciar Métricas"): REGISTRO.reiniciar(); st.rerun()
+
+if panel_rendimiento: mostrar_panel_rendimiento()
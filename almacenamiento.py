@@ -0,0 +1,346 @@
+# Backends de almacenamiento para las hojas de BD_Calidad_Pollito.
+#
+# - AlmacenSheets: Google Sheets a través de gspread (sistema de registro compartido).
+# - AlmacenEspejo: réplica local en SQLite, indexada por lote, que se sincroniza
+#   de forma incremental con otro almacén (normalmente AlmacenSheets).
+# - AlmacenMemoria: sustituto en proceso con las mismas 8 hojas, para pruebas y
+#   benchmarks sin cuenta de Google.
+#
+# Todos devuelven las filas como listas de textos, igual que la API de valores de Sheets.
+import json
+import logging
+import math
+import numbers
+import os
+import sqlite3
+import threading
+import time
+
+from esquema import COLUMNAS_ID, ENCABEZADOS
+from metricas import REGISTRO
+
+logger = logging.getLogger(__name__)
+
+
+def _rango(nombre_hoja, desde_fila):
+    nombre = nombre_hoja.replace("'", "''")
+    return f"'{nombre}'!A{desde_fila}:ZZ"
+
+
+def _sin_vacios_finales(fila):
+    # La API de valores recorta las celdas vacías al final de cada fila
+    fila = list(fila)
+    while fila and fila[-1] == '':
+        fila.pop()
+    return fila
+
+
+def a_texto(valor):
+    # Representación que devuelve Sheets para un valor escrito en modo RAW
+    if valor is None:
+        return ''
+    if isinstance(valor, bool):
+        return 'TRUE' if valor else 'FALSE'
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+
+def _celda(valor):
+    # Equivalente a escribir el valor con valueInputOption=RAW
+    if valor is None:
+        return {}
+    if isinstance(valor, bool):
+        return {'userEnteredValue': {'boolValue': valor}}
+    if isinstance(valor, numbers.Real):
+        return {'userEnteredValue': {'numberValue': float(valor)}} if math.isfinite(valor) else {}
+    return {'userEnteredValue': {'stringValue': str(valor)}}
+
+
+def _columna_id(encabezados):
+    return next((encabezados.index(col) for col in COLUMNAS_ID if col in encabezados), None)
+
+
+def abrir_hoja_calculo(cliente, config):
+    """Abre BD_Calidad_Pollito por su clave (`clave_hoja` en [almacen]), sin buscar en Drive.
+
+    Sin clave configurada se abre por nombre, que exige una búsqueda en Drive en cada arranque.
+    """
+    clave = config.get("clave_hoja")
+    if clave:
+        return cliente.open_by_key(clave)
+    spreadsheet = cliente.open(config.get("nombre_hoja", "BD_Calidad_Pollito"))
+    logger.warning("Hoja abierta por nombre; configure clave_hoja = \"%s\" en [almacen] para abrirla por clave", spreadsheet.id)
+    return spreadsheet
+
+
+def leer_anexos(almacen, marcas):
+    """Lee lo anexado a cada hoja después de su marca de agua, en una sola llamada.
+
+    `marcas` es {nombre_hoja: (filas_conocidas, ultima_fila)}, contando el encabezado.
+    Se relee la última fila conocida como ancla: si ya no coincide, la hoja cambió por
+    algo distinto a un anexado y se devuelve completa. Devuelve
+    {nombre_hoja: (filas, reiniciada)}; cuando no había filas conocidas o la hoja se
+    reinició, `filas` incluye el encabezado.
+    """
+    if not marcas:
+        return {}
+    valores = almacen.leer_desde({nombre: max(total, 1) for nombre, (total, _) in marcas.items()})
+    resultado, reiniciar = {}, []
+    for nombre, (total, ancla) in marcas.items():
+        filas = valores.get(nombre, [])
+        if total == 0:
+            resultado[nombre] = (filas, False)
+        elif filas and _sin_vacios_finales(filas[0]) == _sin_vacios_finales(ancla):
+            resultado[nombre] = (filas[1:], False)
+        else:
+            reiniciar.append(nombre)
+    if reiniciar:
+        completas = almacen.leer_desde({nombre: 1 for nombre in reiniciar})
+        for nombre in reiniciar:
+            resultado[nombre] = (completas.get(nombre, []), True)
+    return resultado
+
+
+class Almacen:
+    """Interfaz común. Las filas se numeran desde 1, como en la hoja (la 1 es el encabezado)."""
+
+    def hojas_existentes(self):
+        raise NotImplementedError
+
+    def leer_desde(self, desde):
+        """{nombre_hoja: fila_inicial} -> {nombre_hoja: [filas desde esa fila]}"""
+        raise NotImplementedError
+
+    def anexar(self, nombre_hoja, filas):
+        raise NotImplementedError
+
+    def anexar_lote(self, operaciones):
+        """Anexa [(nombre_hoja, filas), ...]; los backends que pueden lo hacen en una sola llamada atómica."""
+        for nombre_hoja, filas in operaciones:
+            self.anexar(nombre_hoja, filas)
+
+    def filas_lote(self, nombre_hoja, lote_id):
+        """Devuelve (encabezados, filas) de un solo lote."""
+        valores = self.leer_desde({nombre_hoja: 1}).get(nombre_hoja, [])
+        if not valores:
+            return [], []
+        encabezados, idx = valores[0], _columna_id(valores[0])
+        if idx is None:
+            return encabezados, []
+        return encabezados, [f for f in valores[1:] if len(f) > idx and f[idx].strip() == lote_id]
+
+
+class AlmacenSheets(Almacen):
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+        self._hojas = None
+
+    def _worksheets(self):
+        if self._hojas is None:
+            with REGISTRO.medir('sheets', 'worksheets'):
+                self._hojas = {ws.title: ws for ws in self.spreadsheet.worksheets()}
+        return self._hojas
+
+    def hojas_existentes(self):
+        self._hojas = None
+        return set(self._worksheets())
+
+    def leer_desde(self, desde):
+        nombres = list(desde)
+        with REGISTRO.medir('sheets', 'leer_desde', hojas=len(nombres)) as m:
+            respuesta = self.spreadsheet.values_batch_get([_rango(nombre, desde[nombre]) for nombre in nombres])
+            valores = {nombre: rango.get('values', []) for nombre, rango in zip(nombres, respuesta.get('valueRanges', []))}
+            m['filas'] = sum(map(len, valores.values()))
+        return valores
+
+    def filas_lote(self, nombre_hoja, lote_id):
+        # Consulta acotada: primero el encabezado y la columna de ids, luego solo las filas del lote
+        with REGISTRO.medir('sheets', 'filas_lote', hoja=nombre_hoja) as m:
+            encabezados, filas = self._filas_lote(nombre_hoja, lote_id)
+            m['filas'] = len(filas)
+        return encabezados, filas
+
+    def _filas_lote(self, nombre_hoja, lote_id):
+        nombre = nombre_hoja.replace("'", "''")
+        encabezado, ids = self.spreadsheet.values_batch_get([f"'{nombre}'!1:1", f"'{nombre}'!A:A"]).get('valueRanges', [{}, {}])
+        encabezados = (encabezado.get('values') or [[]])[0]
+        if _columna_id(encabezados) != 0:
+            return super().filas_lote(nombre_hoja, lote_id)
+        numeros = [i for i, fila in enumerate(ids.get('values', []), start=1)
+                   if i > 1 and fila and fila[0].strip() == lote_id]
+        if not numeros:
+            return encabezados, []
+        # Las filas de un lote suelen ser contiguas (se anexan juntas): un rango por tramo
+        tramos = []
+        for n in numeros:
+            if tramos and n == tramos[-1][1] + 1:
+                tramos[-1][1] = n
+            else:
+                tramos.append([n, n])
+        respuesta = self.spreadsheet.values_batch_get([f"'{nombre}'!A{a}:ZZ{b}" for a, b in tramos])
+        filas = [f for rango in respuesta.get('valueRanges', []) for f in rango.get('values', [])]
+        return encabezados, [f for f in filas if f and f[0].strip() == lote_id]
+
+    def _hoja(self, nombre_hoja):
+        return self._worksheets().get(nombre_hoja) or self.spreadsheet.worksheet(nombre_hoja)
+
+    def anexar(self, nombre_hoja, filas):
+        with REGISTRO.medir('sheets', 'anexar', hoja=nombre_hoja, filas=len(filas)):
+            self._hoja(nombre_hoja).append_rows(filas)
+
+    def anexar_lote(self, operaciones):
+        # Un único batchUpdate con appendCells por hoja: la API lo aplica de forma atómica,
+        # así el resumen y su detalle quedan escritos juntos o no se escribe nada
+        requests = [{'appendCells': {'sheetId': self._hoja(nombre_hoja).id,
+                                     'rows': [{'values': [_celda(v) for v in fila]} for fila in filas],
+                                     'fields': 'userEnteredValue'}}
+                    for nombre_hoja, filas in operaciones if filas]
+        if requests:
+            with REGISTRO.medir('sheets', 'anexar_lote', hojas=len(requests), filas=sum(len(r['appendCells']['rows']) for r in requests)):
+                self.spreadsheet.batch_update({'requests': requests})
+
+
+class AlmacenMemoria(Almacen):
+    def __init__(self, encabezados=ENCABEZADOS):
+        self.hojas = {nombre: [list(cols)] for nombre, cols in encabezados.items()}
+        self._lock = threading.Lock()
+
+    def hojas_existentes(self):
+        return set(self.hojas)
+
+    def leer_desde(self, desde):
+        with self._lock:
+            return {nombre: [list(f) for f in self.hojas[nombre][inicio - 1:]]
+                    for nombre, inicio in desde.items() if nombre in self.hojas}
+
+    def anexar(self, nombre_hoja, filas):
+        self.anexar_lote([(nombre_hoja, filas)])
+
+    def anexar_lote(self, operaciones):
+        with self._lock:
+            for nombre_hoja, filas in operaciones:
+                self.hojas[nombre_hoja].extend([a_texto(v) for v in fila] for fila in filas)
+
+
+class AlmacenEspejo(Almacen):
+    """Réplica local en SQLite de otro almacén, con índice por (hoja, lote_id).
+
+    Las lecturas se sirven desde el archivo local tras una sincronización incremental
+    (como mucho una cada `intervalo_sync` segundos). Si el origen no responde se siguen
+    sirviendo los últimos datos replicados. Las escrituras van directo al origen.
+
+    La lista de hojas del origen se guarda y solo se vuelve a pedir tras un error, una
+    hoja reiniciada o una escritura en una hoja desconocida: cada sincronización cuesta
+    una sola lectura. La lectura del origen se hace fuera del lock, así que las consultas
+    locales no esperan a Sheets mientras otra sincronización está en curso.
+    """
+
+    def __init__(self, origen, ruta, intervalo_sync=5):
+        self.origen = origen
+        self.intervalo_sync = intervalo_sync
+        self.ultimo_error = None
+        self._ultima_sync = 0.0
+        self._existentes = None  # hojas del origen (None = volver a listarlas)
+        self._con_datos = False  # ya hubo al menos una sincronización completa
+        self._lock = threading.RLock()  # acceso a SQLite
+        self._lock_sync = threading.Lock()  # una sola sincronización a la vez
+        if os.path.dirname(ruta):
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        self._conn = sqlite3.connect(ruta, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS filas (
+                hoja TEXT NOT NULL, fila INTEGER NOT NULL, lote_id TEXT, valores TEXT NOT NULL,
+                PRIMARY KEY (hoja, fila)
+            );
+            CREATE INDEX IF NOT EXISTS idx_filas_lote ON filas (hoja, lote_id);
+        """)
+
+    def _locales(self):
+        return {nombre for (nombre,) in self._conn.execute("SELECT DISTINCT hoja FROM filas")}
+
+    def _marca(self, nombre):
+        fila = self._conn.execute(
+            "SELECT fila, valores FROM filas WHERE hoja = ? ORDER BY fila DESC LIMIT 1", (nombre,)).fetchone()
+        return (fila[0], json.loads(fila[1])) if fila else (0, None)
+
+    def _encabezados(self, nombre):
+        fila = self._conn.execute("SELECT valores FROM filas WHERE hoja = ? AND fila = 1", (nombre,)).fetchone()
+        return json.loads(fila[0]) if fila else []
+
+    def sincronizar(self, forzar=False):
+        """Trae las filas nuevas del origen. Devuelve False si el origen no respondió.
+
+        Sin `forzar`, si otra sincronización está en curso se sirven los datos locales sin esperarla.
+        """
+        if not self._lock_sync.acquire(blocking=forzar or not self._con_datos):
+            return True
+        try:
+            if not forzar and time.monotonic() - self._ultima_sync < self.intervalo_sync:
+                return True
+            try:
+                with REGISTRO.medir('espejo', 'sincronizar') as m:
+                    if self._existentes is None:
+                        self._existentes = self.origen.hojas_existentes()
+                    with self._lock:
+                        marcas = {nombre: self._marca(nombre) for nombre in self._existentes}
+                    anexos = leer_anexos(self.origen, marcas)
+                    m['filas'] = sum(len(filas) for filas, _ in anexos.values())
+            except Exception as e:
+                self.ultimo_error = e
+                self._existentes = None  # una hoja pudo ser renombrada o eliminada
+                logger.warning("No se pudo sincronizar el espejo local: %s", e)
+                return False
+            with self._lock, self._conn:
+                for nombre, (filas, reiniciada) in anexos.items():
+                    total, _ = self._marca(nombre)
+                    if total != marcas[nombre][0]:
+                        continue  # otro proceso con el mismo archivo ya la actualizó (la app y ingesta.py)
+                    if reiniciada:
+                        self._conn.execute("DELETE FROM filas WHERE hoja = ?", (nombre,))
+                        self._existentes = None
+                        total = 0
+                    encabezados = filas[0] if total == 0 and filas else self._encabezados(nombre)
+                    idx = _columna_id(encabezados)
+                    self._conn.executemany(
+                        "INSERT INTO filas (hoja, fila, lote_id, valores) VALUES (?, ?, ?, ?)",
+                        [(nombre, total + i + 1,
+                          f[idx].strip() if idx is not None and len(f) > idx and total + i > 0 else None,
+                          json.dumps(f)) for i, f in enumerate(filas)])
+            self.ultimo_error = None
+            self._con_datos = True
+            self._ultima_sync = time.monotonic()
+            return True
+        finally:
+            self._lock_sync.release()
+
+    def hojas_existentes(self):
+        self.sincronizar()
+        with self._lock:
+            return self._locales()
+
+    def leer_desde(self, desde):
+        self.sincronizar()
+        with self._lock:
+            return {nombre: [json.loads(v) for (v,) in self._conn.execute(
+                        "SELECT valores FROM filas WHERE hoja = ? AND fila >= ? ORDER BY fila", (nombre, inicio))]
+                    for nombre, inicio in desde.items()}
+
+    def anexar(self, nombre_hoja, filas):
+        self.anexar_lote([(nombre_hoja, filas)])
+
+    def anexar_lote(self, operaciones):
+        try:
+            self.origen.anexar_lote(operaciones)
+        finally:
+            # También si falla: la escritura pudo aplicarse aunque no llegara la respuesta
+            self._ultima_sync = 0.0
+            if self._existentes is not None and any(hoja not in self._existentes for hoja, _ in operaciones):
+                self._existentes = None  # la escritura encontró una hoja que no estaba en la lista guardada
+
+    def filas_lote(self, nombre_hoja, lote_id):
+        self.sincronizar()
+        with self._lock:
+            filas = [json.loads(v) for (v,) in self._conn.execute(
+                "SELECT valores FROM filas WHERE hoja = ? AND lote_id = ? ORDER BY fila", (nombre_hoja, lote_id))]
+            return self._encabezados(nombre_hoja), filas
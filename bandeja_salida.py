@@ -0,0 +1,313 @@
+# Bandeja de salida durable para los formularios.
+#
+# Cada evaluación se guarda al instante en un SQLite local como un "envío" con todas
+# sus filas (resumen + detalle). Un hilo en segundo plano los escribe en el almacén
+# agrupando varios envíos por llamada, con reintentos exponenciales, respeto de la
+# cuota de escritura de Sheets y claves de idempotencia. Las claves de lo ya escrito se
+# conservan `retencion_enviados` segundos para descartar reenvíos del mismo contenido.
+# Los errores que no son transitorios (4xx, datos rechazados…) detienen el envío tras
+# `max_intentos` intentos; queda en la bandeja, visible, hasta que se reactive.
+# Varios procesos pueden compartir el archivo (la app y ingesta.py): cada uno reserva
+# los envíos que va a escribir, y la reserva vence sola si el proceso muere.
+import hashlib
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from metricas import REGISTRO
+
+logger = logging.getLogger(__name__)
+
+_ESTADOS_REINTENTABLES = {408, 429, 500, 502, 503, 504}
+_ESTADOS_TIMEOUT = {408, 504}
+_PENDIENTE = "enviado IS NULL AND NOT detenido"
+
+
+def clave_idempotencia(operaciones):
+    # El mismo contenido enviado dos veces (doble clic, reenvío del formulario) produce la misma clave
+    return hashlib.sha256(_serializar(operaciones).encode()).hexdigest()
+
+
+def _serializar(operaciones):
+    return json.dumps([[hoja, filas] for hoja, filas in operaciones], default=lambda o: o.item())
+
+
+def _codigo_http(error):
+    respuesta = getattr(error, 'response', None)
+    return getattr(respuesta, 'status_code', None)
+
+
+def _error_de_conexion(error):
+    # Corte de red o timeout: la solicitud pudo llegar a Google y aplicarse
+    try:
+        from requests.exceptions import ConnectionError as ErrorConexion, Timeout
+    except ImportError:
+        ErrorConexion = Timeout = ()
+    return isinstance(error, (ConnectionError, TimeoutError, ErrorConexion, Timeout))
+
+
+def _error_de_credenciales(error):
+    # La renovación del token de la cuenta de servicio falló sin red o por un 5xx de OAuth:
+    # la solicitud a Sheets nunca salió, así que se reintenta sin verificar nada
+    try:
+        from google.auth.exceptions import RefreshError, TransportError
+    except ImportError:
+        return False
+    return isinstance(error, TransportError) or isinstance(error, RefreshError) and (
+        error.retryable or isinstance(error.__cause__, TransportError))
+
+
+def _normalizar(valor):
+    # Compara lo escrito con lo leído de Sheets, que devuelve textos formateados
+    texto = '' if valor is None else str(valor).strip()
+    if isinstance(valor, bool) or texto.upper() in ('TRUE', 'FALSE'):
+        return texto.upper()
+    try:
+        return round(float(texto.replace(',', '.')), 6)
+    except ValueError:
+        return texto
+
+
+class LimitadorCuota:
+    """Ventana deslizante de un minuto para no superar las escrituras por minuto de Sheets."""
+
+    def __init__(self, por_minuto):
+        self.por_minuto = por_minuto
+        self._llamadas = deque()
+
+    def espera(self):
+        ahora = time.monotonic()
+        while self._llamadas and ahora - self._llamadas[0] >= 60:
+            self._llamadas.popleft()
+        if len(self._llamadas) < self.por_minuto:
+            return 0.0
+        return 60 - (ahora - self._llamadas[0])
+
+    def registrar(self):
+        self._llamadas.append(time.monotonic())
+
+
+class BandejaSalida:
+    def __init__(self, almacen, ruta, max_envios_por_llamada=20, escrituras_por_minuto=50,
+                 espera_base=2.0, espera_maxima=300.0, max_intentos=3, retencion_enviados=7 * 24 * 3600,
+                 reserva=300.0, al_escribir=None):
+        self.almacen = almacen
+        self.al_escribir = al_escribir  # se llama tras cada escritura confirmada (p. ej. para refrescar la caché)
+        self.max_envios_por_llamada = max_envios_por_llamada
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.max_intentos = max_intentos
+        self.retencion_enviados = retencion_enviados
+        self.reserva = reserva  # segundos que un envío queda reservado por el proceso que lo está escribiendo
+        self.limitador = LimitadorCuota(escrituras_por_minuto)
+        self.ultimo_error = None
+        self._pausa_hasta = 0.0
+        self._evento = threading.Event()
+        self._hilo = None
+        self._lock = threading.RLock()  # acceso a SQLite; nunca se retiene durante una llamada de red
+        self._lock_vaciado = threading.Lock()
+        if ruta != ':memory:' and os.path.dirname(ruta):
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        self._conn = sqlite3.connect(ruta, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS envios (
+                clave TEXT PRIMARY KEY, creado REAL NOT NULL, operaciones TEXT NOT NULL,
+                intentos INTEGER NOT NULL DEFAULT 0, proximo_intento REAL NOT NULL DEFAULT 0,
+                incierto INTEGER NOT NULL DEFAULT 0, ultimo_error TEXT
+            );
+        """)
+        # Bandejas creadas con una versión anterior de la tabla
+        columnas = {c[1] for c in self._conn.execute("PRAGMA table_info(envios)")}
+        with self._conn:
+            if 'enviado' not in columnas:
+                self._conn.execute("ALTER TABLE envios ADD COLUMN enviado REAL")
+                self._conn.execute("DROP INDEX IF EXISTS idx_envios_proximo")
+            if 'detenido' not in columnas:
+                self._conn.execute("ALTER TABLE envios ADD COLUMN detenido INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_envios_pendientes ON envios (enviado, proximo_intento)")
+
+    # --- Encolado (llamado desde los formularios) ---
+    def encolar(self, operaciones, clave=None):
+        """Guarda el envío de forma durable y despierta al hilo. Devuelve la clave de idempotencia.
+
+        Si la clave ya está en la bandeja (pendiente o escrita hace menos de `retencion_enviados`) no se encola de nuevo;
+        si estaba detenida, se reactiva.
+        """
+        operaciones = [(hoja, filas) for hoja, filas in operaciones if filas]
+        clave = clave or clave_idempotencia(operaciones)
+        with self._lock, self._conn:
+            self._conn.execute("INSERT INTO envios (clave, creado, operaciones) VALUES (?, ?, ?) ON CONFLICT (clave) "
+                               "DO UPDATE SET detenido = 0, intentos = 0, proximo_intento = 0 WHERE detenido",
+                               (clave, time.time(), _serializar(operaciones)))
+        self._evento.set()
+        return clave
+
+    def pendientes(self):
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM envios WHERE {_PENDIENTE}").fetchone()[0]
+
+    def claves_pendientes(self):
+        """{clave: último error (o None)} de los envíos que siguen en la bandeja."""
+        with self._lock:
+            return dict(self._conn.execute(f"SELECT clave, ultimo_error FROM envios WHERE {_PENDIENTE}").fetchall())
+
+    def detenidos(self):
+        """{clave: último error} de los envíos detenidos por un error que no es transitorio."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT clave, ultimo_error FROM envios WHERE detenido").fetchall())
+
+    def reactivar(self, claves=None):
+        """Vuelve a poner en cola los envíos detenidos (todos si `claves` es None)."""
+        with self._lock, self._conn:
+            if claves is None:
+                self._conn.execute("UPDATE envios SET detenido = 0, intentos = 0, proximo_intento = 0 WHERE detenido")
+            else:
+                self._conn.executemany("UPDATE envios SET detenido = 0, intentos = 0, proximo_intento = 0 "
+                                       "WHERE detenido AND clave = ?", [(c,) for c in claves])
+        self._evento.set()
+
+    def filas_pendientes(self, nombre_hoja, lote_id):
+        """Filas aún no escritas de una hoja para un lote (la primera columna es el id del lote)."""
+        with self._lock:
+            envios = self._conn.execute(f"SELECT operaciones FROM envios WHERE {_PENDIENTE} ORDER BY creado").fetchall()
+        return [fila for (ops,) in envios for hoja, filas in json.loads(ops)
+                if hoja == nombre_hoja for fila in filas if fila and str(fila[0]).strip() == lote_id]
+
+    # --- Hilo de escritura ---
+    def iniciar(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            self._hilo = threading.Thread(target=self._bucle, daemon=True, name="bandeja_salida")
+            self._hilo.start()
+        return self
+
+    def _bucle(self):
+        while True:
+            try:
+                espera = self.vaciar()
+            except Exception:
+                logger.exception("Error inesperado en la bandeja de salida")
+                espera = self.espera_base
+            self._evento.wait(timeout=espera)
+            self._evento.clear()
+
+    def vaciar(self):
+        """Escribe lo que toca enviar. Devuelve los segundos hasta el próximo intento (None si está vacía)."""
+        with self._lock_vaciado:
+            ahora = time.time()
+            if ahora < self._pausa_hasta:
+                return self._pausa_hasta - ahora
+            envios = self._reclamar(ahora)
+            try:
+                espera = self._enviar(envios) if envios else None
+            finally:
+                self._liberar(envios, ahora)
+            return espera if espera is not None else self._proximo_intento(time.time())
+
+    def _reclamar(self, ahora):
+        # Cada UPDATE es atómico entre procesos: si otro ya reservó el envío, no lo toca
+        with self._lock, self._conn:
+            candidatos = self._conn.execute(
+                f"SELECT clave, operaciones, intentos, incierto FROM envios WHERE {_PENDIENTE} AND proximo_intento <= ? "
+                "ORDER BY creado LIMIT ?", (ahora, self.max_envios_por_llamada)).fetchall()
+            return [e for e in candidatos if self._conn.execute(
+                "UPDATE envios SET proximo_intento = ? WHERE clave = ? AND proximo_intento <= ?",
+                (ahora + self.reserva, e[0], ahora)).rowcount]
+
+    def _liberar(self, envios, ahora):
+        # Los reservados que no se escribieron ni se reprogramaron vuelven a estar disponibles
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE envios SET proximo_intento = ? WHERE clave = ? AND proximo_intento = ?",
+                                   [(ahora, e[0], ahora + self.reserva) for e in envios])
+
+    def _enviar(self, envios):
+        """Escribe envíos ya reservados. Devuelve la espera impuesta por la cuota, o None."""
+        # Un envío cuyo último intento falló de forma ambigua pudo haberse escrito: se verifica antes de repetirlo.
+        # Si no se puede leer el almacén se pospone, en lugar de arriesgar un duplicado.
+        if any(e[3] for e in envios):
+            sincronizar = getattr(self.almacen, 'sincronizar', None)  # una réplica local puede ir atrasada
+            al_dia = sincronizar is None or sincronizar(forzar=True)
+            escritos = {e[0]: self._ya_escrito(json.loads(e[1])) if al_dia else None for e in envios if e[3]}
+            confirmados = [clave for clave, escrito in escritos.items() if escrito]
+            if confirmados:
+                self._confirmar(confirmados)
+            self._posponer([e for e in envios if e[0] in escritos and escritos[e[0]] is None])
+            envios = [e for e in envios if escritos.get(e[0], False) is False]
+
+        # Los envíos nuevos viajan juntos; uno que ya falló se reintenta solo para no bloquear a los demás
+        lote = envios[:1] if envios and envios[0][2] > 0 else [e for e in envios if e[2] == 0]
+        if not lote:
+            return None
+        espera = self.limitador.espera()
+        if espera > 0:
+            return espera
+
+        operaciones = [(hoja, filas) for e in lote for hoja, filas in json.loads(e[1])]
+        self.limitador.registrar()
+        try:
+            with REGISTRO.medir('bandeja', 'envio', envios=len(lote), filas=sum(len(filas) for _, filas in operaciones)):
+                self.almacen.anexar_lote(operaciones)
+        except Exception as e:
+            self._registrar_fallo(lote, e)
+            return None
+        self._confirmar([e[0] for e in lote])
+        self.ultimo_error = None
+        if self.al_escribir:
+            self.al_escribir()
+        return None
+
+    def _proximo_intento(self, ahora):
+        with self._lock:
+            proximo = self._conn.execute(f"SELECT MIN(proximo_intento) FROM envios WHERE {_PENDIENTE}").fetchone()[0]
+        return None if proximo is None else max(proximo - ahora, 0.0)
+
+    def _confirmar(self, claves):
+        # Se conserva la clave (sin el contenido) para reconocer reenvíos; las más antiguas que la retención se borran
+        ahora = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE envios SET enviado = ?, operaciones = '[]', ultimo_error = NULL WHERE clave = ?",
+                                   [(ahora, c) for c in claves])
+            self._conn.execute("DELETE FROM envios WHERE enviado < ?", (ahora - self.retencion_enviados,))
+
+    def _espera(self, intentos):
+        return min(self.espera_base * 2 ** intentos, self.espera_maxima) * random.uniform(0.8, 1.2)
+
+    def _posponer(self, envios):
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE envios SET proximo_intento = ? WHERE clave = ?",
+                                   [(time.time() + self._espera(intentos), clave) for clave, _, intentos, _ in envios])
+
+    def _registrar_fallo(self, lote, error):
+        codigo = _codigo_http(error)
+        self.ultimo_error = error
+        logger.warning("Fallo al escribir %d envío(s) (HTTP %s): %s", len(lote), codigo, error)
+        if codigo == 429:
+            # Cuota agotada: se pausa toda la bandeja, no solo estos envíos
+            self._pausa_hasta = time.time() + 60
+        # Solo tras un corte de conexión o un timeout no se sabe si la escritura llegó a aplicarse
+        incierto = _error_de_conexion(error) or codigo in _ESTADOS_TIMEOUT
+        # Los fallos transitorios se reintentan sin límite; los demás se detienen tras max_intentos
+        transitorio = incierto or codigo in _ESTADOS_REINTENTABLES or _error_de_credenciales(error)
+        with self._lock, self._conn:
+            for clave, _, intentos, _ in lote:
+                detenido = not transitorio and intentos + 1 >= self.max_intentos
+                if detenido:
+                    logger.error("Envío %s detenido tras %d intentos: %s", clave[:12], intentos + 1, error)
+                self._conn.execute(
+                    "UPDATE envios SET intentos = intentos + 1, proximo_intento = ?, incierto = ?, detenido = ?, "
+                    "ultimo_error = ? WHERE clave = ?", (time.time() + self._espera(intentos), int(incierto), int(detenido), str(error), clave))
+
+    def _ya_escrito(self, operaciones):
+        """True/False según lo que hay en el almacén; None si no se pudo leer."""
+        hoja, filas = operaciones[0]
+        try:
+            _, existentes = self.almacen.filas_lote(hoja, str(filas[0][0]).strip())
+        except Exception as e:
+            logger.warning("No se pudo verificar un envío incierto: %s", e)
+            return None
+        buscada = [_normalizar(v) for v in filas[0]]
+        return any([_normalizar(v) for v in f[:len(buscada)]] == buscada for f in existentes)
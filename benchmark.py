@@ -0,0 +1,128 @@
+# Benchmark del flujo carga -> puntuación -> dashboard -> exportación con datos sintéticos.
+#
+# Corre cada paso contra AlmacenMemoria a varias escalas y reporta tiempo y memoria pico:
+#   python benchmark.py                      # escalas por defecto
+#   python benchmark.py --escalas 20000 --salida resultados.csv
+# El tiempo se mide sin trazar memoria; la memoria pico (tracemalloc, asignaciones de Python
+# y NumPy) se mide en una segunda ejecución del mismo paso.
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+import pandas as pd
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+
+from almacenamiento import AlmacenMemoria
+from carga_datos import CacheHojas
+from datos_sinteticos import generar, poblar
+from esquema import ENCABEZADOS
+from exportacion import EXPORTABLES, csv_lote, exportar_zip
+from puntuacion import calcular_puntuacion, puntuar_lotes
+from tendencias import tendencia
+
+ESCALAS = [1000, 5000, 20000]
+LOTES_MUESTRA = 200  # lotes consultados en los pasos que trabajan lote a lote
+
+
+def medir(funcion, memoria=True):
+    """(segundos, MB pico) de una llamada; el pico es None si `memoria` es False."""
+    gc.collect()
+    inicio = time.perf_counter()
+    funcion()
+    segundos = time.perf_counter() - inicio
+    if not memoria:
+        return segundos, None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        funcion()
+        pico = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+    return segundos, pico
+
+
+def descargar(datos):
+    # Lo mismo que hace st.download_button con lo que devuelve una descarga diferida:
+    # falla si el tipo no es uno de los que acepta
+    contenido, _ = convert_data_to_bytes_and_infer_mime(datos, TypeError(f"st.download_button no acepta {type(datos).__name__}"))
+    if hasattr(datos, 'close'):
+        datos.close()
+    return contenido
+
+
+def pasos(almacen, n_lotes, semilla=0):
+    """[(nombre, función)] de los caminos calientes, en el orden en que los recorre la app."""
+    cache = CacheHojas(almacen)
+    indice = cache.obtener()
+    rng = random.Random(semilla)
+    muestra = rng.sample(indice.lotes(), min(LOTES_MUESTRA, len(indice.lotes())))
+    detalle = indice.marcos['pollitos_detalle']
+    siguiente = iter(range(n_lotes, n_lotes + 10 ** 6))
+
+    def anexar_y_refrescar():
+        # Un lote nuevo completo (las 8 hojas) y la lectura incremental que lo incorpora
+        filas = generar(1, desde=next(siguiente), semilla=semilla)
+        almacen.anexar_lote([(nombre, filas[nombre]) for nombre in ENCABEZADOS])
+        cache.refrescar(reutilizar=False)
+
+    def puntuar_uno_a_uno():
+        for lote in muestra:
+            calcular_puntuacion(indice.filas('pollitos_detalle', lote).copy(), 30)
+
+    def consultar_lotes():
+        # Lo que hace el Paso 5 al elegir un lote: KPIs del agregado y filas de cada hoja
+        for lote in muestra:
+            indice.agregado(lote)
+            for clave in EXPORTABLES.values():
+                indice.filas(clave, lote)
+
+    return [
+        ("carga completa", lambda: CacheHojas(almacen).obtener()),
+        ("carga incremental (+1 lote)", anexar_y_refrescar),
+        (f"calcular_puntuacion ({len(muestra)} lotes)", puntuar_uno_a_uno),
+        ("puntuar_lotes (todos)", lambda: puntuar_lotes(detalle, 30)),
+        (f"Paso 5: consulta ({len(muestra)} lotes)", consultar_lotes),
+        ("Paso 5: tendencias por granja", lambda: tendencia(cache.obtener().tendencias, 'granja_origen')),
+        (f"CSV por lote ({len(muestra)} lotes)", lambda: [descargar(csv_lote(indice, lote)) for lote in muestra]),
+        ("ZIP CSV (todos)", lambda: descargar(exportar_zip(indice, None, 'csv'))),
+        ("ZIP Parquet (todos)", lambda: descargar(exportar_zip(indice, None, 'parquet'))),
+    ]
+
+
+def ejecutar(escalas=ESCALAS, memoria=True, semilla=0, informar=print):
+    resultados = []
+    for n_lotes in escalas:
+        almacen = AlmacenMemoria()
+        inicio = time.perf_counter()
+        poblar(almacen, n_lotes, semilla=semilla)
+        filas = sum(len(f) - 1 for f in almacen.hojas.values())
+        informar(f"{n_lotes} lotes: {filas} filas generadas en {time.perf_counter() - inicio:.1f} s")
+        for nombre, funcion in pasos(almacen, n_lotes, semilla):
+            segundos, pico = medir(funcion, memoria)
+            resultados.append({'lotes': n_lotes, 'filas': filas, 'paso': nombre, 'segundos': round(segundos, 4),
+                               'pico_mb': None if pico is None else round(pico, 1)})
+            informar(f"  {nombre:<36} {segundos:9.3f} s" + ("" if pico is None else f" {pico:9.1f} MB"))
+        del almacen
+    return pd.DataFrame(resultados)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga, puntuación, dashboard y exportación con datos sintéticos")
+    parser.add_argument("--escalas", default=",".join(map(str, ESCALAS)),
+                        help="número de lotes por escala, separados por comas")
+    parser.add_argument("--sin-memoria", action="store_true", help="solo tiempos (evita la segunda ejecución)")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--salida", help="CSV donde guardar los resultados para comparar entre versiones")
+    args = parser.parse_args()
+    resultados = ejecutar([int(n) for n in args.escalas.split(",")], not args.sin_memoria, args.semilla)
+    if args.salida:
+        resultados.to_csv(args.salida, index=False)
+    print()
+    print(resultados.pivot_table(index='paso', columns='lotes', values='segundos', sort=False).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+# Carga de las hojas de BD_Calidad_Pollito con caché compartida entre sesiones.
+#
+# Las hojas son de solo-anexado: cada lectura pide al almacén, en una única llamada
+# (un batchGet en Sheets), solo las filas posteriores a la marca de agua de cada hoja. Los
+# datos vencidos se siguen sirviendo mientras un solo hilo los refresca en segundo plano.
+import logging
+import threading
+import time
+
+import pandas as pd
+
+from almacenamiento import a_texto, leer_anexos
+from esquema import COLUMNAS_ID, ENCABEZADOS, HOJAS, TIPOS
+from indice_lotes import IndiceLotes
+from metricas import REGISTRO
+from tendencias import CuboTendencias
+
+logger = logging.getLogger(__name__)
+
+
+def _numero(serie):
+    texto = serie.astype(str)
+    if texto.str.contains(',', regex=False).any():
+        texto = texto.str.replace(',', '.', regex=False)
+    return pd.to_numeric(texto, errors='coerce')
+
+
+def _entero(serie):
+    numeros = _numero(serie)
+    # Si alguien escribió un decimal en una columna de conteo se conserva como float
+    return numeros.astype('Int32') if (numeros.dropna() % 1 == 0).all() else numeros
+
+
+def _fecha(serie):
+    fechas = pd.to_datetime(serie, errors='coerce', format='ISO8601')
+    # Fechas escritas a mano en la hoja con el formato local (dd/mm/aaaa)
+    fallidas = fechas.isna() & serie.astype(str).str.strip().ne('')
+    if fallidas.any():
+        fechas[fallidas] = pd.to_datetime(serie[fallidas], errors='coerce', dayfirst=True, format='mixed')
+    return fechas
+
+
+def _booleano(serie):
+    # Sheets devuelve 'TRUE'/'FALSE' exactos; solo el resto pasa por strip/upper
+    texto = serie.astype(str)
+    verdadero = texto.eq('TRUE')
+    otros = ~verdadero & texto.ne('FALSE')
+    if otros.any():
+        verdadero[otros] = texto[otros].str.strip().str.upper().eq('TRUE')
+    return verdadero.astype(bool)
+
+
+_CONVERSORES = {
+    'categoria': lambda serie: serie.astype(str).str.strip().astype('category'),
+    'bool': _booleano,
+    'float32': lambda serie: _numero(serie).astype('float32'),
+    'float64': _numero,
+    'entero': _entero,
+    'fecha': _fecha,
+    'texto': lambda serie: serie,
+}
+
+
+def limpiar_tipos(df):
+    # Tipado por nombre de columna, solo para columnas que no están en el esquema
+    for col in df.columns:
+        if col in COLUMNAS_ID:
+            df[col] = df[col].astype(str).str.strip()
+        elif '_ok' not in col and 'fecha' not in col and 'hora' not in col:
+            df[col] = _numero(df[col])
+    return df
+
+
+def tipar(nombre_hoja, df):
+    """Convierte cada columna una sola vez al tipo compacto declarado en esquema.TIPOS."""
+    tipos = TIPOS.get(nombre_hoja, {})
+    sin_esquema = [col for col in df.columns if col not in tipos]
+    for col in df.columns:
+        if col in tipos:
+            df[col] = _CONVERSORES[tipos[col]](df[col])
+    if sin_esquema:
+        df[sin_esquema] = limpiar_tipos(df[sin_esquema].copy())
+    return df
+
+
+def concatenar(anterior, *nuevos):
+    # Une las categorías antes de concatenar para que las columnas sigan siendo 'category'.
+    # Al primer marco (el histórico) solo se le agregan categorías, sin recodificarlo.
+    anterior, nuevos = anterior.copy(deep=False), [nuevo.copy(deep=False) for nuevo in nuevos]
+    for col in anterior.columns:
+        if not isinstance(anterior[col].dtype, pd.CategoricalDtype):
+            continue
+        categoricos = [n for n in nuevos if col in n.columns and isinstance(n[col].dtype, pd.CategoricalDtype)]
+        for nuevo in categoricos:
+            faltantes = nuevo[col].cat.categories.difference(anterior[col].cat.categories)
+            if len(faltantes):
+                anterior[col] = anterior[col].cat.add_categories(faltantes)
+        for nuevo in categoricos:
+            nuevo[col] = nuevo[col].cat.set_categories(anterior[col].cat.categories)
+    return pd.concat([anterior, *nuevos], ignore_index=True)
+
+
+def construir_marco(nombre_hoja, encabezados, filas):
+    # Las filas de la API pueden venir más cortas que el encabezado (celdas vacías al final)
+    ancho = len(encabezados)
+    if any(len(f) != ancho for f in filas):
+        filas = [(list(f) + [''] * ancho)[:ancho] for f in filas]
+    return tipar(nombre_hoja, pd.DataFrame(filas, columns=encabezados, dtype=object))
+
+
+class _EstadoHoja:
+    """Filas tipadas de una hoja.
+
+    Cada lectura incremental se guarda como un bloque aparte; los bloques se unen al
+    histórico recién al pedir `marco`, en una sola concatenación. Esa unión copia el
+    histórico completo de la hoja (cuesta O(filas totales)), pero solo ocurre en las
+    hojas que recibieron filas y una vez por refresco, no por cada lectura.
+    """
+
+    def __init__(self, nombre_hoja, encabezados):
+        self.nombre_hoja = nombre_hoja
+        self.encabezados = encabezados
+        self.filas = 0  # filas de datos ya leídas (la marca de agua)
+        self.ultima_fila = None
+        self._marco = construir_marco(nombre_hoja, encabezados, [])
+        self._bloques = []
+
+    @property
+    def marco(self):
+        if self._bloques:
+            partes = self._bloques if self._marco.empty else [self._marco, *self._bloques]
+            self._bloques = []
+            with REGISTRO.medir('carga', 'concatenar', hoja=self.nombre_hoja, filas=self.filas):
+                self._marco = partes[0] if len(partes) == 1 else concatenar(*partes)
+        return self._marco
+
+    def anexar(self, filas):
+        if not filas:
+            return
+        self.ultima_fila = list(filas[-1])
+        self.filas += len(filas)
+        with REGISTRO.medir('carga', 'tipado', hoja=self.nombre_hoja, filas=len(filas)):
+            self._bloques.append(construir_marco(self.nombre_hoja, self.encabezados, filas))
+
+
+class CacheHojas:
+    """Caché de las 8 hojas compartida por todas las sesiones (stale-while-revalidate).
+
+    `obtener()` devuelve un IndiceLotes y nunca bloquea si ya hay datos: si están
+    vencidos devuelve los últimos buenos y lanza un único refresco en segundo plano.
+    Con `claves` solo se leen esas hojas; las demás quedan como DataFrames vacíos.
+    """
+
+    def __init__(self, almacen, ttl=300, claves=None):
+        self._almacen = almacen
+        self.ttl = ttl
+        self._hojas = {clave: HOJAS[clave] for clave in claves} if claves else HOJAS
+        self._estados = {}
+        self._existentes = None
+        self._datos = None
+        self._actualizado = 0.0
+        self._generacion = 0
+        self._lock_refresco = threading.Lock()
+        self._en_segundo_plano = False
+        self._repetir = False
+        self._afectados = None  # lotes con filas nuevas en la última lectura (None = cambió todo)
+        self._reconstruir = False
+        self._cubo = CuboTendencias()
+        self.ultimo_error = None
+
+    def vencido(self):
+        return time.monotonic() - self._actualizado > self.ttl
+
+    def obtener(self):
+        if self._datos is None:
+            REGISTRO.registrar('cache', 'fallo')
+            return self.refrescar()
+        if self.vencido():
+            REGISTRO.registrar('cache', 'vencido')
+            self.refrescar_en_segundo_plano()
+        else:
+            REGISTRO.registrar('cache', 'acierto')
+        return self._datos
+
+    def refrescar(self, reutilizar=True):
+        # Single-flight: quien llega mientras otro hilo refresca espera y reutiliza su resultado
+        generacion = self._generacion
+        with self._lock_refresco:
+            if reutilizar and self._generacion != generacion and self._datos is not None:
+                return self._datos
+            try:
+                with REGISTRO.medir('carga', 'leer_y_tipar'):
+                    self._leer_incremental()
+            except Exception as e:
+                self.ultimo_error = e
+                self._existentes = None  # una hoja pudo ser renombrada o eliminada
+                self._reconstruir = True
+                raise
+            self.ultimo_error = None
+            afectados = None if self._reconstruir else self._afectados
+            if afectados or afectados is None or self._datos is None:
+                with REGISTRO.medir('carga', 'indice', lotes=None if afectados is None else len(afectados)):
+                    datos = IndiceLotes({clave: (self._estados[clave].marco if clave in self._estados else pd.DataFrame())
+                                         for clave in HOJAS}, anterior=self._datos, afectados=afectados)
+                    datos.tendencias = self._cubo.actualizar(datos.agregados, afectados)
+                self._datos = datos
+                self._reconstruir = False
+            self._actualizado = time.monotonic()
+            self._generacion += 1
+            return self._datos
+
+    def buscar_lote(self, lote_id, claves, pendientes=None, solo_indice=False):
+        """Filas de un solo lote en las hojas indicadas, sin recargar ni invalidar la caché.
+
+        Se sirven desde el índice si la instantánea está vigente y ya conoce el lote; si no,
+        con una consulta acotada al almacén solo para ese lote (salvo con `solo_indice`, para
+        quien acaba de refrescar y consulta muchos lotes). `pendientes(nombre_hoja, lote_id)`
+        permite sumar filas que aún no llegaron al almacén (bandeja de salida).
+        """
+        datos = self._datos
+        if datos is not None and (solo_indice or not self.vencido() and datos.agregado(lote_id) is not None):
+            REGISTRO.registrar('cache', 'lote_acierto')
+            resultado = {clave: datos.filas(clave, lote_id) for clave in claves}
+        else:
+            REGISTRO.registrar('cache', 'lote_fallo')
+            resultado = {}
+            for clave in claves:
+                encabezados, filas = self._almacen.filas_lote(HOJAS[clave], lote_id)
+                if not encabezados and clave in self._estados:
+                    encabezados = self._estados[clave].encabezados
+                resultado[clave] = construir_marco(HOJAS[clave], encabezados, filas) if encabezados else pd.DataFrame()
+        if pendientes:
+            for clave in claves:
+                extra = [[a_texto(v) for v in fila] for fila in pendientes(HOJAS[clave], lote_id)]
+                if not extra:
+                    continue
+                actual = resultado[clave]
+                nuevo = construir_marco(HOJAS[clave], list(actual.columns) or ENCABEZADOS[HOJAS[clave]], extra)
+                resultado[clave] = nuevo if actual.empty else concatenar(actual, nuevo)
+        return resultado
+
+    def refrescar_en_segundo_plano(self):
+        # Si ya hay un refresco en curso se pide otra vuelta: pudo haber leído antes de una escritura reciente
+        if self._en_segundo_plano:
+            self._repetir = True
+            return
+        self._en_segundo_plano = True
+        threading.Thread(target=self._refrescar_silencioso, daemon=True).start()
+
+    def _refrescar_silencioso(self):
+        try:
+            while True:
+                self._repetir = False
+                self.refrescar(reutilizar=False)
+                if not self._repetir:
+                    break
+        except Exception:
+            logger.exception("Error al refrescar las hojas en segundo plano")
+        finally:
+            self._en_segundo_plano = False
+
+    def _leer_incremental(self):
+        self._afectados = set()
+        if self._existentes is None:
+            self._existentes = self._almacen.hojas_existentes()
+            self._estados = {clave: est for clave, est in self._estados.items() if HOJAS[clave] in self._existentes}
+            self._afectados = None
+        marcas = {}
+        for clave, nombre in self._hojas.items():
+            if nombre in self._existentes:
+                estado = self._estados.get(clave)
+                marcas[nombre] = (estado.filas + 1, estado.ultima_fila or estado.encabezados) if estado else (0, None)
+        anexos = leer_anexos(self._almacen, marcas)
+        for clave, nombre in self._hojas.items():
+            if nombre not in anexos:
+                continue
+            filas, reiniciada = anexos[nombre]
+            if reiniciada or clave not in self._estados:
+                self._estados.pop(clave, None)
+                if not filas:
+                    continue
+                self._estados[clave] = _EstadoHoja(HOJAS[clave], filas[0])
+                filas = filas[1:]
+                self._afectados = None
+            elif filas and self._afectados is not None:
+                idx = next((self._estados[clave].encabezados.index(col) for col in COLUMNAS_ID
+                            if col in self._estados[clave].encabezados), None)
+                self._afectados.update(f[idx].strip() for f in filas if idx is not None and len(f) > idx)
+            self._estados[clave].anexar(filas)
@@ -0,0 +1,140 @@
+# Generador de datos sintéticos para las 8 hojas de BD_Calidad_Pollito.
+#
+# Produce las mismas filas que escriben los formularios de App_pollito.py (mismos
+# encabezados, tipos y redondeos; los resúmenes se puntúan con el Método Rodriguez
+# sobre su propio detalle), para pruebas de carga y benchmarks sin cuenta de Google.
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from esquema import ENCABEZADOS, PARAMETROS_OK
+from puntuacion import puntuar_lotes
+
+GRANJAS = [f"Granja {i:02d}" for i in range(1, 13)]
+LINEAS = ["Cobb", "Ross", "Otra"]
+EVALUADORES = ["Ana Pérez", "Luis Gómez", "Marta Ruiz", "Jorge Díaz", "Sofía León"]
+CONDUCTORES = ["Pedro Mora", "Raúl Vega", "Iván Soto", "Hugo Castro"]
+PLACAS = [f"TRK-{i:03d}" for i in range(1, 41)]
+COMPORTAMIENTOS = ["Calmos", "Ruidosos (frío)", "Jadeando (calor)", "Letárgicos"]
+# Fracción de lotes que llega a cada etapa posterior a la incubadora
+COBERTURA = {'transporte': 0.95, 'granja': 0.9, 'seguimiento': 0.85}
+_TEXTO_OK = np.array(['FALSE', 'TRUE'], dtype=object)
+
+
+def _filas(*columnas):
+    return [list(fila) for fila in zip(*(c.tolist() if isinstance(c, np.ndarray) else c for c in columnas))]
+
+
+def _r(valores, decimales=2):
+    return np.round(np.asarray(valores, dtype=float), decimales)
+
+
+def _detalle(rng, lote_ids, pollitos, calidad, peso_medio, peso_desvio, columna_temp=None, temp_media=None):
+    """Filas de detalle (30 pollitos por lote) y el DataFrame tipado que se usa para los resúmenes."""
+    n = len(lote_ids) * pollitos
+    ids = np.repeat(np.asarray(lote_ids, dtype=object), pollitos)
+    oks = rng.random((n, len(PARAMETROS_OK))) < np.repeat(calidad, pollitos)[:, None]
+    peso = _r(rng.normal(np.repeat(peso_medio, pollitos), peso_desvio), 1)
+    df = pd.DataFrame({'lote_id': ids, **{p: oks[:, j] for j, p in enumerate(PARAMETROS_OK)}, 'peso': peso})
+    columnas = [ids, np.tile(np.arange(1, pollitos + 1), len(lote_ids))] + [_TEXTO_OK[oks[:, j].astype(int)]
+                                                                            for j in range(len(PARAMETROS_OK))] + [peso]
+    if columna_temp:
+        temp = _r(rng.normal(temp_media, 0.4, n), 1)
+        df['temp'] = temp
+        columnas.append(temp)
+    return _filas(*columnas), df
+
+
+def _por_lote(df, lote_ids, columna_peso):
+    # Puntuación y estadísticas de cada lote, como las calculan los formularios
+    puntajes = puntuar_lotes(df.rename(columns={'peso': columna_peso}), 30).reindex(lote_ids)
+    grupos = df.groupby('lote_id', sort=False)
+    stats = pd.DataFrame({'peso_medio': grupos['peso'].mean(), 'cv_peso': grupos['peso'].std() / grupos['peso'].mean() * 100})
+    if 'temp' in df.columns:
+        stats['temp_media'] = grupos['temp'].mean()
+        stats['cv_temp'] = grupos['temp'].std() / stats['temp_media'] * 100
+    return puntajes.join(stats.reindex(lote_ids))
+
+
+def generar(n_lotes, desde=0, pollitos=30, semilla=0, inicio=date(2024, 1, 1), lotes_por_dia=20, cobertura=COBERTURA):
+    """Filas de `n_lotes` lotes (ids LS000000…, a partir del número `desde`) para cada hoja.
+
+    Devuelve {nombre_hoja: [filas]} con valores como los escriben los formularios
+    (los booleanos de detalle ya como 'TRUE'/'FALSE').
+    """
+    rng = np.random.default_rng([semilla, desde])
+    numeros = np.arange(desde, desde + n_lotes)
+    lote_ids = [f"LS{i:06d}" for i in numeros]
+    nacimiento = [inicio + timedelta(days=int(d)) for d in numeros // lotes_por_dia]
+    granja = np.array(GRANJAS, dtype=object)[rng.integers(len(GRANJAS), size=n_lotes)]
+    edad = rng.integers(24, 66, size=n_lotes)
+    calidad = rng.beta(18, 2, size=n_lotes)
+    peso_huevo = _r(rng.normal(52 + (edad - 24) * 0.35, 1.5))
+    cantidad = rng.integers(10, 61, size=n_lotes) * 1000
+    filas = {}
+
+    # Paso 0: el lote de huevo usa el mismo id que el de pollitos, que es como la app los asocia
+    filas["Huevo_Recepcion"] = _filas(
+        lote_ids, granja, edad, [str(f - timedelta(days=21)) for f in nacimiento], _r(rng.uniform(15, 25, n_lotes), 1),
+        rng.integers(0, 60, n_lotes), _r(rng.gamma(2, 0.8, n_lotes)), _r(rng.gamma(1.5, 0.5, n_lotes)),
+        peso_huevo, _r(rng.normal(7, 1.2, n_lotes)))
+
+    # Paso 1: incubadora
+    det_inc, df_inc = _detalle(rng, lote_ids, pollitos, calidad, peso_huevo * 0.68, 2.8, 'temp_cloacal', 40.2)
+    inc = _por_lote(df_inc, lote_ids, 'peso_gr')
+    filas["Pollitos_Detalle"] = det_inc
+    filas["Lotes_Resumen"] = _filas(
+        lote_ids, granja, np.array(LINEAS, dtype=object)[rng.integers(len(LINEAS), size=n_lotes)], [str(f) for f in nacimiento],
+        cantidad, np.array(EVALUADORES, dtype=object)[rng.integers(len(EVALUADORES), size=n_lotes)],
+        _r(rng.uniform(18, 25, n_lotes), 1), _r(rng.uniform(16, 20, n_lotes), 1), _r(rng.uniform(18, 24, n_lotes), 1),
+        (rng.random(n_lotes) < 0.1).tolist(), rng.integers(80, 121, n_lotes), _r(inc['temp_media']),
+        _r(inc['puntuacion_final']), _r(inc['uniformidad']), _r(inc['cv_peso']))
+
+    # Paso 2: transporte
+    sel = np.flatnonzero(rng.random(n_lotes) < cobertura['transporte'])
+    salida = rng.integers(4 * 60, 10 * 60, len(sel))
+    duracion = rng.integers(30, 300, len(sel))
+    hora = lambda minutos: [f"{m // 60 % 24:02d}:{m % 60:02d}:00" for m in minutos]
+    temp_inicio = _r(rng.uniform(20, 30, len(sel)), 1)
+    filas["Transporte_Evaluacion"] = _filas(
+        [lote_ids[i] for i in sel], [str(nacimiento[i]) for i in sel],
+        np.array(PLACAS, dtype=object)[rng.integers(len(PLACAS), size=len(sel))],
+        np.array(CONDUCTORES, dtype=object)[rng.integers(len(CONDUCTORES), size=len(sel))], hora(salida), hora(salida + duracion),
+        duracion, temp_inicio, rng.integers(50, 80, len(sel)), _r(temp_inicio + rng.normal(1, 1.5, len(sel)), 1),
+        rng.integers(50, 80, len(sel)), np.array(COMPORTAMIENTOS, dtype=object)[rng.choice(4, len(sel), p=[0.7, 0.1, 0.15, 0.05])],
+        rng.poisson(cantidad[sel] * 0.0005))
+
+    # Paso 3: recepción en granja
+    sel = np.flatnonzero(rng.random(n_lotes) < cobertura['granja'])
+    ids_granja = [lote_ids[i] for i in sel]
+    det_gra, df_gra = _detalle(rng, ids_granja, pollitos, calidad[sel] * 0.98, inc['peso_medio'].to_numpy()[sel] * 0.96, 3.0,
+                               'temp_cloacal_granja_c', 40.0)
+    gra = _por_lote(df_gra, ids_granja, 'peso_granja_gr')
+    filas["Granja_Detalle_Calidad"] = det_gra
+    filas["Granja_Evaluacion"] = _filas(
+        ids_granja, [str(nacimiento[i]) for i in sel], np.array(EVALUADORES, dtype=object)[rng.integers(len(EVALUADORES), size=len(sel))],
+        _r(rng.uniform(28, 35, len(sel)), 1), rng.integers(40, 81, len(sel)), _r(rng.uniform(28, 34, len(sel)), 1),
+        _r(rng.binomial(50, 0.9, len(sel)) / 50 * 100), _r(gra['cv_temp']), _r(gra['cv_peso']), _r(gra['puntuacion_final']))
+
+    # Paso 4: seguimiento a 7 días (solo lotes con recepción en granja)
+    sub = np.flatnonzero(rng.random(len(sel)) < cobertura['seguimiento'] / cobertura['granja'])
+    ids_seg = [ids_granja[i] for i in sub]
+    llegada = gra['peso_medio'].to_numpy()[sub]
+    det_seg, df_seg = _detalle(rng, ids_seg, pollitos, calidad[sel][sub], llegada * rng.normal(4.4, 0.3, len(sub)), 14.0)
+    seg = _por_lote(df_seg, ids_seg, 'peso_7d_gr')
+    mortalidad = rng.poisson(cantidad[sel][sub] * 0.012)
+    filas["Seguimiento_7_Dias_Detalle"] = det_seg
+    filas["Seguimiento_7_Dias_Resumen"] = _filas(
+        ids_seg, [str(nacimiento[sel[i]] + timedelta(days=7)) for i in sub], _r(seg['peso_medio']), _r(seg['cv_peso']),
+        _r((seg['peso_medio'].to_numpy() - llegada) / 7), _r(seg['peso_medio'].to_numpy() / llegada),
+        mortalidad, _r(mortalidad / cantidad[sel][sub] * 100))
+    return filas
+
+
+def poblar(almacen, n_lotes, desde=0, bloque=2000, **opciones):
+    """Anexa `n_lotes` lotes sintéticos al almacén, de `bloque` en `bloque` lotes."""
+    for inicio in range(desde, desde + n_lotes, bloque):
+        filas = generar(min(bloque, desde + n_lotes - inicio), desde=inicio, **opciones)
+        almacen.anexar_lote([(nombre, filas[nombre]) for nombre in ENCABEZADOS])
+    return almacen
@@ -0,0 +1,64 @@
+# Estructura de las hojas de BD_Calidad_Pollito.
+# Los encabezados siguen el orden exacto de las filas que escribe cada formulario de App_pollito.py.
+
+# Clave interna -> nombre de la hoja (las claves de IndiceLotes.marcos)
+HOJAS = {
+    "huevo_recepcion": "Huevo_Recepcion", "lotes_resumen": "Lotes_Resumen",
+    "pollitos_detalle": "Pollitos_Detalle", "transporte": "Transporte_Evaluacion",
+    "granja_resumen": "Granja_Evaluacion", "granja_detalle": "Granja_Detalle_Calidad",
+    "seguimiento_resumen": "Seguimiento_7_Dias_Resumen", "seguimiento_detalle": "Seguimiento_7_Dias_Detalle"
+}
+COLUMNAS_ID = ['id_lote_huevo', 'lote_id']
+
+PARAMETROS_OK = ['vitalidad_ok', 'ombligo_ok', 'patas_ok', 'ojos_ok', 'pico_ok', 'abdomen_ok', 'plumon_ok', 'cuello_ok']
+
+ENCABEZADOS = {
+    "Huevo_Recepcion": ['id_lote_huevo', 'granja_origen', 'edad_reproductoras', 'fecha_recepcion', 'temp_camion', 'tiempo_espera_min',
+                        'porc_huevos_sucios', 'porc_huevos_fisurados', 'peso_promedio_huevo_gr', 'cv_peso_huevo_pct'],
+    "Lotes_Resumen": ['lote_id', 'granja_origen', 'linea_genetica', 'fecha_nacimiento', 'cantidad_total', 'evaluador', 'temp_furgon',
+                      'temp_cascara', 'temp_salon', 'huevo_sudado', 'aves_por_caja', 'temp_cloacal_promedio', 'puntuacion_final',
+                      'uniformidad', 'cv_peso'],
+    "Pollitos_Detalle": ['lote_id', 'numero_pollito'] + PARAMETROS_OK + ['peso_gr', 'temp_cloacal'],
+    "Transporte_Evaluacion": ['lote_id', 'fecha', 'placa_vehiculo', 'conductor', 'hora_salida', 'hora_llegada', 'duracion_min',
+                              'temp_inicio', 'hum_inicio', 'temp_final', 'hum_final', 'comportamiento_llegada', 'mortalidad_transporte'],
+    "Granja_Evaluacion": ['lote_id', 'fecha_recepcion', 'evaluador_granja', 'temp_ambiente_c', 'hum_relativa_pct', 'temp_cama_c',
+                          'buche_lleno_24h_pct', 'cv_temp_cloacal_pct', 'cv_peso_granja_pct', 'puntuacion_final_granja'],
+    "Granja_Detalle_Calidad": ['lote_id', 'numero_pollito'] + PARAMETROS_OK + ['peso_granja_gr', 'temp_cloacal_granja_c'],
+    "Seguimiento_7_Dias_Resumen": ['lote_id', 'fecha_eval_7d', 'peso_promedio_7d', 'cv_peso_7d_pct', 'gdp_gr_dia', 'factor_crecimiento',
+                                   'mortalidad_acumulada_7d_n', 'mortalidad_acumulada_7d_pct'],
+    "Seguimiento_7_Dias_Detalle": ['lote_id', 'numero_pollito'] + PARAMETROS_OK + ['peso_7d_gr'],
+}
+
+# Tipo de cada columna al cargar. Las columnas que no aparezcan aquí se tipan por su nombre
+# (ver carga_datos.limpiar_tipos), como se hacía antes de declarar el esquema.
+#   categoria: ids y textos repetidos      bool: 'TRUE'/'FALSE' de Sheets
+#   float32: temperaturas y %              float64: pesos y puntuaciones
+#   (los pesos entran en la uniformidad del Método Rodriguez: en float32 los bordes del ±10 % cambian)
+#   entero: conteos (Int32 nullable)       fecha: datetime64
+#   texto: texto libre sin convertir
+_TIPOS_DETALLE = {'lote_id': 'categoria', 'numero_pollito': 'entero', **{col: 'bool' for col in PARAMETROS_OK}}
+TIPOS = {
+    "Huevo_Recepcion": {'id_lote_huevo': 'categoria', 'granja_origen': 'categoria', 'edad_reproductoras': 'entero',
+                        'fecha_recepcion': 'fecha', 'temp_camion': 'float32', 'tiempo_espera_min': 'entero',
+                        'porc_huevos_sucios': 'float32', 'porc_huevos_fisurados': 'float32',
+                        'peso_promedio_huevo_gr': 'float64', 'cv_peso_huevo_pct': 'float32'},
+    "Lotes_Resumen": {'lote_id': 'categoria', 'granja_origen': 'categoria', 'linea_genetica': 'categoria',
+                      'fecha_nacimiento': 'fecha', 'cantidad_total': 'entero', 'evaluador': 'categoria',
+                      'temp_furgon': 'float32', 'temp_cascara': 'float32', 'temp_salon': 'float32', 'huevo_sudado': 'bool',
+                      'aves_por_caja': 'entero', 'temp_cloacal_promedio': 'float32', 'puntuacion_final': 'float64',
+                      'uniformidad': 'float32', 'cv_peso': 'float32'},
+    "Pollitos_Detalle": {**_TIPOS_DETALLE, 'peso_gr': 'float64', 'temp_cloacal': 'float32'},
+    "Transporte_Evaluacion": {'lote_id': 'categoria', 'fecha': 'fecha', 'placa_vehiculo': 'categoria', 'conductor': 'categoria',
+                              'hora_salida': 'texto', 'hora_llegada': 'texto', 'duracion_min': 'entero',
+                              'temp_inicio': 'float32', 'hum_inicio': 'float32', 'temp_final': 'float32', 'hum_final': 'float32',
+                              'comportamiento_llegada': 'categoria', 'mortalidad_transporte': 'entero'},
+    "Granja_Evaluacion": {'lote_id': 'categoria', 'fecha_recepcion': 'fecha', 'evaluador_granja': 'categoria',
+                          'temp_ambiente_c': 'float32', 'hum_relativa_pct': 'float32', 'temp_cama_c': 'float32',
+                          'buche_lleno_24h_pct': 'float32', 'cv_temp_cloacal_pct': 'float32', 'cv_peso_granja_pct': 'float32',
+                          'puntuacion_final_granja': 'float64'},
+    "Granja_Detalle_Calidad": {**_TIPOS_DETALLE, 'peso_granja_gr': 'float64', 'temp_cloacal_granja_c': 'float32'},
+    "Seguimiento_7_Dias_Resumen": {'lote_id': 'categoria', 'fecha_eval_7d': 'fecha', 'peso_promedio_7d': 'float64',
+                                   'cv_peso_7d_pct': 'float32', 'gdp_gr_dia': 'float32', 'factor_crecimiento': 'float32',
+                                   'mortalidad_acumulada_7d_n': 'entero', 'mortalidad_acumulada_7d_pct': 'float32'},
+    "Seguimiento_7_Dias_Detalle": {**_TIPOS_DETALLE, 'peso_7d_gr': 'float64'},
+}
@@ -0,0 +1,108 @@
+# Exportación de datos de uno, varios o todos los lotes.
+#
+# La exportación masiva escribe un ZIP con una entrada por hoja (CSV comprimido o Parquet),
+# recorriendo cada hoja por bloques de filas: la memoria usada depende del tamaño del
+# bloque y no del tamaño del histórico.
+import io
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+# Nombre en la exportación -> clave de la hoja en IndiceLotes.marcos
+EXPORTABLES = {'lote_resumen': 'lotes_resumen', 'pollitos_incubadora': 'pollitos_detalle', 'transporte': 'transporte',
+               'granja_resumen': 'granja_resumen', 'pollitos_granja': 'granja_detalle',
+               'seguimiento_resumen': 'seguimiento_resumen', 'seguimiento_detalle': 'seguimiento_detalle'}
+FORMATOS = {'csv': 'CSV comprimido', 'parquet': 'Parquet'}
+TAMANO_BLOQUE = 50_000
+
+
+def _como_en_la_hoja(df):
+    # Los booleanos se escriben como en Sheets (TRUE/FALSE), no con la grafía de Python
+    booleanas = [col for col, tipo in df.dtypes.items() if tipo == bool]
+    if not booleanas:
+        return df
+    df = df.copy(deep=False)
+    df[booleanas] = np.where(df[booleanas].to_numpy(), 'TRUE', 'FALSE')
+    return df
+
+
+def csv_lote(indice, lote_id):
+    """CSV de un solo lote: una sección por hoja, como la descarga original del dashboard."""
+    output = io.StringIO()
+    for name, clave in EXPORTABLES.items():
+        df_lote = indice.filas(clave, lote_id)
+        if not df_lote.empty:
+            output.write(f"--- {name.upper()} ---\n")
+            _como_en_la_hoja(df_lote).to_csv(output, index=False)
+            output.write("\n\n")
+    return output.getvalue()
+
+
+def lotes_en_rango(indice, desde=None, hasta=None):
+    """Lotes cuya fecha de nacimiento cae en [desde, hasta] (extremos opcionales)."""
+    agregados = indice.agregados
+    if agregados.empty:
+        return []
+    fechas = agregados['fecha_nacimiento']
+    mascara = fechas.notna()
+    if desde is not None:
+        mascara &= fechas >= np.datetime64(desde)
+    if hasta is not None:
+        mascara &= fechas <= np.datetime64(hasta)
+    return list(agregados.index[mascara])
+
+
+def _escribir_csv(zf, nombre, df, posiciones, tamano_bloque):
+    with zf.open(f"{nombre}.csv", 'w', force_zip64=True) as binario, \
+            io.TextIOWrapper(binario, encoding='utf-8', newline='') as texto:
+        for inicio in range(0, len(posiciones), tamano_bloque):
+            _como_en_la_hoja(df.iloc[posiciones[inicio:inicio + tamano_bloque]]).to_csv(texto, index=False, header=inicio == 0)
+
+
+def _escribir_parquet(zf, nombre, df, posiciones, tamano_bloque):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    with zf.open(f"{nombre}.parquet", 'w', force_zip64=True) as binario:
+        escritor = None
+        for inicio in range(0, len(posiciones), tamano_bloque):
+            tabla = pa.Table.from_pandas(df.iloc[posiciones[inicio:inicio + tamano_bloque]], preserve_index=False,
+                                         schema=escritor.schema if escritor else None)
+            if escritor is None:
+                escritor = pq.ParquetWriter(binario, tabla.schema)
+            escritor.write_table(tabla)
+        if escritor is not None:
+            escritor.close()
+
+
+def exportar_zip(indice, lotes=None, formato='csv', tamano_bloque=TAMANO_BLOQUE, destino=None):
+    """Escribe un ZIP con una entrada por hoja para `lotes` (None = todos).
+
+    Con `destino` (un archivo binario) escribe en él. Sin él, escribe en un temporal en disco
+    y lo devuelve abierto para lectura (io.BufferedReader, uno de los tipos que acepta
+    st.download_button); el temporal ya está borrado y desaparece al cerrarse.
+    """
+    if destino is not None:
+        _escribir_zip(indice, lotes, formato, tamano_bloque, destino)
+        return destino
+    fd, ruta = tempfile.mkstemp(prefix='pollito_', suffix='.zip')
+    try:
+        with os.fdopen(fd, 'wb') as archivo:
+            _escribir_zip(indice, lotes, formato, tamano_bloque, archivo)
+        return open(ruta, 'rb')
+    finally:
+        try:
+            os.unlink(ruta)
+        except OSError:  # Windows no borra un archivo abierto
+            pass
+
+
+def _escribir_zip(indice, lotes, formato, tamano_bloque, destino):
+    escribir = {'csv': _escribir_csv, 'parquet': _escribir_parquet}[formato]
+    with zipfile.ZipFile(destino, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for nombre, clave in EXPORTABLES.items():
+            posiciones = indice.posiciones(clave, lotes)
+            if len(posiciones):
+                escribir(zf, nombre, indice.marcos[clave], posiciones, tamano_bloque)
@@ -0,0 +1,160 @@
+# Índice por lote y agregados por lote, construidos una sola vez por cada carga de datos.
+#
+# El dashboard consulta un lote con búsquedas en diccionario (posiciones por lote_id)
+# en lugar de recorrer cada DataFrame con una máscara booleana en cada rerun.
+# Tras una lectura incremental solo se indexan las filas nuevas y se recalculan los
+# agregados de los lotes que las recibieron; el resto se reutiliza de la instantánea anterior.
+import numpy as np
+import pandas as pd
+
+from esquema import COLUMNAS_ID
+
+# (hoja resumen, columnas) cuyo valor por lote es el de la primera fila, como en el dashboard
+_COLUMNAS_RESUMEN = {
+    "lotes_resumen": ['puntuacion_final', 'uniformidad', 'cv_peso'],
+    "granja_resumen": ['puntuacion_final_granja', 'buche_lleno_24h_pct', 'cv_peso_granja_pct'],
+    "seguimiento_resumen": ['mortalidad_acumulada_7d_pct', 'cv_peso_7d_pct', 'peso_promedio_7d'],
+}
+# Atributos descriptivos del lote para las tendencias entre lotes (NaN si faltan).
+# Ninguna columna vincula el lote de huevo (Paso 0) con el de pollitos (Paso 1): se asocian
+# solo cuando ambos se registraron con el mismo id; si no, la edad queda sin dato.
+_ATRIBUTOS = {
+    "lotes_resumen": ('lote_id', ['fecha_nacimiento', 'granja_origen', 'linea_genetica']),
+    "huevo_recepcion": ('id_lote_huevo', ['edad_reproductoras']),
+}
+# (hoja detalle, columna de peso) -> columna con el peso promedio por lote
+_PESOS_DETALLE = {
+    ("pollitos_detalle", 'peso_gr'): 'peso_incubadora_gr',
+    ("granja_detalle", 'peso_granja_gr'): 'peso_granja_gr',
+    ("seguimiento_detalle", 'peso_7d_gr'): 'peso_7d_detalle_gr',
+}
+
+
+def _columna_id(df):
+    return next((col for col in COLUMNAS_ID if col in df.columns), None)
+
+
+def _primeras(df, id_col):
+    # Una hoja sin filas conserva sus columnas y tipos (para que los agregados parciales coincidan)
+    if df is None or id_col not in df.columns:
+        return pd.DataFrame()
+    primeras = df.drop_duplicates(id_col, keep='first').set_index(id_col)
+    primeras.index = primeras.index.astype(str)
+    return primeras
+
+
+def calcular_agregados(marcos):
+    """Tabla con una fila por lote (índice lote_id) con los valores que usan los KPIs."""
+    lotes = marcos.get("lotes_resumen")
+    if lotes is None or lotes.empty or 'lote_id' not in lotes.columns:
+        return pd.DataFrame()
+    # lote_id llega como 'category': el índice de agregados usa texto para búsquedas .loc directas
+    agregados = pd.DataFrame(index=pd.Index(lotes['lote_id'].drop_duplicates().astype(str), name='lote_id'))
+
+    for clave, columnas in _COLUMNAS_RESUMEN.items():
+        primeras = _primeras(marcos.get(clave), 'lote_id')
+        if clave != "lotes_resumen":
+            agregados[f"tiene_{clave.split('_')[0]}"] = agregados.index.isin(primeras.index)
+        for col in columnas:
+            # Igual que .get(col, 0) sobre la primera fila: 0 si la columna no existe en la hoja
+            valores = primeras[col] if col in primeras.columns else pd.Series(0.0, index=primeras.index)
+            agregados[col] = valores.reindex(agregados.index)
+
+    for clave, (id_col, columnas) in _ATRIBUTOS.items():
+        primeras = _primeras(marcos.get(clave), id_col)
+        for col in columnas:
+            agregados[col] = primeras[col].reindex(agregados.index) if col in primeras.columns else np.nan
+
+    for (clave, col), destino in _PESOS_DETALLE.items():
+        df = marcos.get(clave)
+        if df is not None and col in df.columns and 'lote_id' in df.columns:
+            promedios = df.groupby('lote_id', sort=False, observed=True)[col].mean()
+            promedios.index = promedios.index.astype(str)
+            agregados[destino] = promedios.reindex(agregados.index)
+        else:
+            agregados[destino] = np.nan
+
+    p_inc, p_gra = agregados['puntuacion_final'], agregados['puntuacion_final_granja']
+    agregados['caida_calidad_pct'] = np.where(p_inc > 0, (p_inc - p_gra) / p_inc * 100, 0)
+    peso_inc, peso_gra = agregados['peso_incubadora_gr'], agregados['peso_granja_gr']
+    agregados['merma_peso_pct'] = np.where((peso_inc > 0) & (peso_gra > 0), (peso_inc - peso_gra) / peso_inc * 100, np.nan)
+    return agregados
+
+
+def actualizar_agregados(anterior, parciales):
+    """`anterior` con los lotes de `parciales` (hojas con solo las filas de esos lotes) recalculados o añadidos."""
+    parcial = calcular_agregados(parciales)
+    if anterior.empty or parcial.empty:
+        return parcial if anterior.empty else anterior
+    orden = anterior.index.append(parcial.index.difference(anterior.index, sort=False))
+    agregados = pd.concat([anterior[~anterior.index.isin(parcial.index)], parcial]).reindex(orden)
+    # Las categorías de las filas nuevas pueden ampliar las anteriores: se conserva el tipo del cálculo nuevo
+    categoricas = {col: tipo for col, tipo in parcial.dtypes.items()
+                   if isinstance(tipo, pd.CategoricalDtype) and agregados[col].dtype != tipo}
+    return agregados.astype(categoricas) if categoricas else agregados
+
+
+def _indexar(df, previas=None, desde=0):
+    """{lote_id: posiciones} de una hoja; con `previas` solo se indexan las filas a partir de `desde`."""
+    id_col = _columna_id(df) if df is not None else None
+    if not id_col or df.empty:
+        return {}
+    if previas is None:
+        return df.groupby(id_col, sort=False, observed=True).indices
+    if desde == len(df):
+        return previas
+    posiciones = dict(previas)
+    for lote, nuevas in df.iloc[desde:].groupby(id_col, sort=False, observed=True).indices.items():
+        nuevas = nuevas + desde
+        posiciones[lote] = np.concatenate([posiciones[lote], nuevas]) if lote in posiciones else nuevas
+    return posiciones
+
+
+class IndiceLotes:
+    """Instantánea inmutable de una carga: los DataFrames, sus posiciones por lote y los agregados.
+
+    Con `anterior` y `afectados` (lotes con filas nuevas, anexadas al final de cada hoja) se
+    parte de la instantánea anterior y solo se recalcula lo de esos lotes.
+    """
+
+    def __init__(self, marcos, anterior=None, afectados=None):
+        self.marcos = marcos
+        incremental = anterior is not None and afectados is not None
+        self._posiciones = {}
+        for clave, df in marcos.items():
+            previo = anterior.marcos.get(clave) if incremental else None
+            if previo is not None and df is not None and len(previo) <= len(df):
+                self._posiciones[clave] = _indexar(df, anterior._posiciones.get(clave, {}), len(previo))
+            else:
+                self._posiciones[clave] = _indexar(df)
+        if incremental:
+            parciales = {clave: df.iloc[self.posiciones(clave, afectados)] for clave, df in marcos.items() if df is not None}
+            self.agregados = actualizar_agregados(anterior.agregados, parciales)
+        else:
+            self.agregados = calcular_agregados(marcos)
+        self.tendencias = pd.DataFrame()  # tabla del cubo de tendencias, la asigna CacheHojas
+        self._lotes = sorted(self.agregados.index, reverse=True)
+
+    def lotes(self):
+        return self._lotes
+
+    def filas(self, clave, lote_id):
+        df = self.marcos.get(clave)
+        if df is None:
+            return pd.DataFrame()
+        posiciones = self._posiciones.get(clave, {}).get(lote_id)
+        return df.iloc[posiciones] if posiciones is not None else df.iloc[0:0]
+
+    def posiciones(self, clave, lotes=None):
+        """Posiciones (en orden de la hoja) de las filas de `lotes` en una hoja; None = todas."""
+        df = self.marcos.get(clave)
+        if df is None or df.empty:
+            return np.array([], dtype=np.intp)
+        if lotes is None:
+            return np.arange(len(df))
+        partes = [p for p in (self._posiciones.get(clave, {}).get(lote) for lote in lotes) if p is not None]
+        return np.sort(np.concatenate(partes)) if partes else np.array([], dtype=np.intp)
+
+    def agregado(self, lote_id):
+        return self.agregados.loc[lote_id] if lote_id in self.agregados.index else None
+
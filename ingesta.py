@@ -0,0 +1,373 @@
+# Ingesta masiva, sin interfaz, de evaluaciones recogidas en campo (Paso 0 a Paso 4).
+#
+# Lee un archivo de resumen (una fila por lote, con los campos del formulario) y, en los
+# pasos que lo tienen, uno de detalle (una fila por pollito o huevo). Valida cada lote con
+# los mismos límites que los formularios, calcula los resúmenes y la puntuación con las
+# mismas reglas (puntuar_lotes) y encola un envío por lote en la bandeja de salida, que
+# escribe en Sheets por tandas respetando la cuota. Reporta el resultado de cada lote.
+#
+#   python ingesta.py --paso 1 --resumen lotes.csv --detalle pollitos.csv
+#   python ingesta.py --paso 3 --resumen campo.xlsx#Resumen --detalle campo.xlsx#Detalle --simular
+import argparse
+import os
+import sys
+import time
+import tomllib
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from almacenamiento import AlmacenEspejo, AlmacenSheets, abrir_hoja_calculo
+from bandeja_salida import BandejaSalida
+from carga_datos import CacheHojas
+from esquema import HOJAS, PARAMETROS_OK
+from metricas import REGISTRO
+from puntuacion import puntuar_lotes
+
+MUESTRA = 30
+Campo = namedtuple('Campo', 'tipo minimo maximo opciones obligatorio', defaults=(None, None, None, True))
+_TEXTO_LIBRE = Campo('texto', obligatorio=False)
+_OK = {col: Campo('booleano') for col in PARAMETROS_OK}
+_VERDADEROS, _FALSOS = {'TRUE', 'VERDADERO', 'SI', 'SÍ', '1'}, {'FALSE', 'FALSO', 'NO', '0'}
+
+# Por paso: columna de id, hoja de resumen (y su clave en HOJAS) y los campos de entrada con
+# los límites de los widgets del formulario; el detalle lleva siempre la columna de id.
+PASOS = {
+    0: {'id': 'id_lote_huevo', 'clave': 'huevo_recepcion',
+        'resumen': {'granja_origen': Campo('texto'), 'edad_reproductoras': Campo('entero', 20, 80),
+                    'fecha_recepcion': Campo('fecha'), 'temp_camion': Campo('decimal', 15, 25),
+                    'tiempo_espera_min': Campo('entero', 0), 'huevos_sucios': Campo('entero', 0),
+                    'huevos_fisurados': Campo('entero', 0), 'total_muestra': Campo('entero', 30)},
+        'detalle': {'peso_huevo_gr': Campo('decimal', 0)}},
+    1: {'id': 'lote_id', 'clave': 'lotes_resumen', 'clave_detalle': 'pollitos_detalle',
+        'resumen': {'granja_origen': Campo('texto'), 'linea_genetica': Campo('texto', opciones=["Cobb", "Ross", "Otra"]),
+                    'fecha_nacimiento': Campo('fecha'), 'cantidad_total': Campo('entero', 1), 'evaluador': Campo('texto'),
+                    'temp_furgon': Campo('decimal', 18, 25), 'temp_cascara': Campo('decimal', 16, 20),
+                    'temp_salon': Campo('decimal', 18, 24), 'huevo_sudado': Campo('booleano'),
+                    'aves_por_caja': Campo('entero', 50, 150)},
+        'detalle': {'numero_pollito': Campo('entero', 1), **_OK, 'peso_gr': Campo('decimal', 0), 'temp_cloacal': Campo('decimal', 0)}},
+    2: {'id': 'lote_id', 'clave': 'transporte',
+        'resumen': {'fecha': Campo('fecha'), 'placa_vehiculo': _TEXTO_LIBRE, 'conductor': _TEXTO_LIBRE,
+                    'hora_salida': Campo('hora'), 'hora_llegada': Campo('hora'),
+                    'temp_inicio': Campo('decimal', 18, 35), 'hum_inicio': Campo('entero', 30, 80),
+                    'temp_final': Campo('decimal', 18, 35), 'hum_final': Campo('entero', 30, 80),
+                    'comportamiento_llegada': Campo('texto', opciones=["Calmos", "Ruidosos (frío)", "Jadeando (calor)", "Letárgicos"]),
+                    'mortalidad_transporte': Campo('entero', 0)}},
+    3: {'id': 'lote_id', 'clave': 'granja_resumen', 'clave_detalle': 'granja_detalle',
+        'resumen': {'fecha_recepcion': Campo('fecha'), 'evaluador_granja': _TEXTO_LIBRE,
+                    'temp_ambiente_c': Campo('decimal', 28, 35), 'hum_relativa_pct': Campo('entero', 40, 80),
+                    'temp_cama_c': Campo('decimal', 28, 34), 'muestra_buche_n': Campo('entero', 30),
+                    'llenos_buche_24h_n': Campo('entero', 0)},
+        'detalle': {'numero_pollito': Campo('entero', 1), **_OK, 'peso_granja_gr': Campo('decimal', 0),
+                    'temp_cloacal_granja_c': Campo('decimal', 0)}},
+    4: {'id': 'lote_id', 'clave': 'seguimiento_resumen', 'clave_detalle': 'seguimiento_detalle',
+        'resumen': {'fecha_eval_7d': Campo('fecha'), 'mortalidad_acumulada_7d_n': Campo('entero', 0)},
+        'detalle': {'numero_pollito': Campo('entero', 1), **_OK, 'peso_7d_gr': Campo('decimal', 0)}},
+}
+
+
+class ErrorArchivo(ValueError):
+    """Archivo que no se puede ingerir en absoluto (faltan columnas, formato desconocido)."""
+
+
+# --- Lectura y validación ---
+def leer_tabla(ruta):
+    """CSV (separador , o ;) o Excel; en Excel se elige la hoja con 'archivo.xlsx#Hoja'."""
+    ruta, _, hoja = ruta.partition('#')
+    extension = os.path.splitext(ruta)[1].lower()
+    if extension == '.csv':
+        df = pd.read_csv(ruta, dtype=str, keep_default_na=False, sep=None, engine='python', encoding='utf-8-sig')
+    elif extension in ('.xlsx', '.xlsm', '.xls'):
+        df = pd.read_excel(ruta, sheet_name=hoja or 0, dtype=str, keep_default_na=False)
+    else:
+        raise ErrorArchivo(f"Formato no soportado: {ruta}")
+    df.columns = [str(col).strip().lower() for col in df.columns]
+    return df.apply(lambda col: col.str.strip())
+
+
+def _fecha(valor):
+    for formato in ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y-%m-%d %H:%M:%S'):
+        try:
+            return datetime.strptime(valor, formato).date()
+        except ValueError:
+            pass
+    return None
+
+
+def _hora(valor):
+    for formato in ('%H:%M:%S', '%H:%M'):
+        try:
+            return datetime.strptime(valor, formato).time()
+        except ValueError:
+            pass
+    return None
+
+
+def _convertir(texto, campo):
+    """Serie tipada y máscara de valores inválidos (vacíos obligatorios incluidos)."""
+    vacio = texto.eq('')
+    if campo.tipo == 'texto':
+        valores = texto
+        invalido = ~texto.isin(campo.opciones) if campo.opciones else pd.Series(False, index=texto.index)
+    elif campo.tipo in ('entero', 'decimal'):
+        valores = pd.to_numeric(texto.str.replace(',', '.', regex=False), errors='coerce').astype(float)
+        invalido = valores.isna() & ~vacio
+        if campo.tipo == 'entero':
+            invalido |= valores.notna() & (valores % 1 != 0)
+        if campo.minimo is not None:
+            invalido |= valores < campo.minimo
+        if campo.maximo is not None:
+            invalido |= valores > campo.maximo
+    elif campo.tipo == 'booleano':
+        mayusculas = texto.str.upper()
+        valores = mayusculas.isin(_VERDADEROS)
+        invalido = ~mayusculas.isin(_VERDADEROS | _FALSOS) & ~vacio
+    else:
+        valores = texto.map({'fecha': _fecha, 'hora': _hora}[campo.tipo])
+        invalido = valores.isna() & ~vacio
+    if campo.obligatorio:
+        invalido |= vacio
+    return valores, invalido
+
+
+def _limites(campo):
+    if campo.opciones:
+        return f" (opciones: {', '.join(campo.opciones)})"
+    if campo.minimo is None and campo.maximo is None:
+        return ""
+    return f" (rango {'-∞' if campo.minimo is None else campo.minimo} a {'∞' if campo.maximo is None else campo.maximo})"
+
+
+def validar(df, campos, id_col, errores):
+    """Tipa las columnas de `campos` y anota en `errores` {lote: [mensajes]} cada valor inválido."""
+    faltantes = [col for col in [id_col, *campos] if col not in df.columns]
+    if faltantes:
+        raise ErrorArchivo(f"Faltan columnas: {', '.join(faltantes)}")
+    tipado = pd.DataFrame({id_col: df[id_col]}, index=df.index)
+    for col, campo in campos.items():
+        tipado[col], invalido = _convertir(df[col], campo)
+        for lote, valor in zip(df.loc[invalido, id_col], df.loc[invalido, col]):
+            errores.setdefault(lote, []).append(f"{col}: valor inválido '{valor}'{_limites(campo)}")
+    sin_id = tipado[id_col].eq('')
+    if sin_id.any():
+        errores.setdefault('', []).append(f"{int(sin_id.sum())} fila(s) sin {id_col}")
+    return tipado[~sin_id]
+
+
+# --- Cálculos (mismas fórmulas que los formularios de App_pollito.py) ---
+def _cv(grupos, col):
+    media = grupos[col].mean()
+    return (grupos[col].std() / media * 100).where(media > 0, 0), media
+
+
+def _filas_detalle(detalle, columnas, id_col):
+    # Como los formularios: booleanos como 'TRUE'/'FALSE', enteros como int
+    salida = detalle[[id_col, *columnas]].copy()
+    for col in columnas:
+        if col in PARAMETROS_OK:
+            salida[col] = np.where(salida[col], 'TRUE', 'FALSE')
+        elif col == 'numero_pollito':
+            salida[col] = salida[col].astype(int)
+    return {lote: filas.values.tolist() for lote, filas in salida.groupby(id_col, sort=False)}
+
+
+def construir_envios(paso, resumen, detalle, contexto):
+    """{lote: [(nombre_hoja, filas), ...]} para los lotes de `resumen` (ya validados)."""
+    spec = PASOS[paso]
+    id_col = spec['id']
+    r = resumen.set_index(id_col)
+    grupos = detalle.groupby(id_col, sort=False) if detalle is not None else None
+    hoja = HOJAS[spec['clave']]
+    if paso == 0:
+        cv, media = _cv(grupos, 'peso_huevo_gr')
+        filas = pd.DataFrame({'granja_origen': r['granja_origen'], 'edad_reproductoras': r['edad_reproductoras'].astype(int),
+                              'fecha_recepcion': r['fecha_recepcion'].astype(str), 'temp_camion': r['temp_camion'],
+                              'tiempo_espera_min': r['tiempo_espera_min'].astype(int),
+                              'porc_huevos_sucios': (r['huevos_sucios'] / r['total_muestra'] * 100).round(2),
+                              'porc_huevos_fisurados': (r['huevos_fisurados'] / r['total_muestra'] * 100).round(2),
+                              'peso_promedio_huevo_gr': media.reindex(r.index).round(2), 'cv_peso_huevo_pct': cv.reindex(r.index).round(2)})
+        return {lote: [(hoja, [[lote, *fila]])] for lote, fila in zip(filas.index, filas.values.tolist())}
+    if paso == 2:
+        salida = pd.to_datetime(r['hora_salida'].astype(str), format='%H:%M:%S')
+        llegada = pd.to_datetime(r['hora_llegada'].astype(str), format='%H:%M:%S')
+        filas = pd.DataFrame({'fecha': r['fecha'].astype(str), 'placa_vehiculo': r['placa_vehiculo'], 'conductor': r['conductor'],
+                              'hora_salida': r['hora_salida'].astype(str), 'hora_llegada': r['hora_llegada'].astype(str),
+                              'duracion_min': ((llegada - salida).dt.total_seconds() / 60).astype(int),
+                              'temp_inicio': r['temp_inicio'], 'hum_inicio': r['hum_inicio'].astype(int), 'temp_final': r['temp_final'],
+                              'hum_final': r['hum_final'].astype(int), 'comportamiento_llegada': r['comportamiento_llegada'],
+                              'mortalidad_transporte': r['mortalidad_transporte'].astype(int)})
+        return {lote: [(hoja, [[lote, *fila]])] for lote, fila in zip(filas.index, filas.values.tolist())}
+
+    columnas_detalle = list(spec['detalle'])
+    peso_col = next(col for col in columnas_detalle if col.startswith('peso'))
+    puntajes = puntuar_lotes(detalle, MUESTRA, id_col=id_col).reindex(r.index)
+    cv_peso, peso_medio = _cv(grupos, peso_col)
+    cv_peso, peso_medio = cv_peso.reindex(r.index), peso_medio.reindex(r.index)
+    if paso == 1:
+        filas = pd.DataFrame({'granja_origen': r['granja_origen'], 'linea_genetica': r['linea_genetica'],
+                              'fecha_nacimiento': r['fecha_nacimiento'].astype(str), 'cantidad_total': r['cantidad_total'].astype(int),
+                              'evaluador': r['evaluador'], 'temp_furgon': r['temp_furgon'], 'temp_cascara': r['temp_cascara'],
+                              'temp_salon': r['temp_salon'], 'huevo_sudado': r['huevo_sudado'], 'aves_por_caja': r['aves_por_caja'].astype(int),
+                              'temp_cloacal_promedio': grupos['temp_cloacal'].mean().reindex(r.index).round(2),
+                              'puntuacion_final': puntajes['puntuacion_final'].round(2), 'uniformidad': puntajes['uniformidad'].round(2),
+                              'cv_peso': cv_peso.round(2)})
+    elif paso == 3:
+        cv_temp, _ = _cv(grupos, 'temp_cloacal_granja_c')
+        buche = (r['llenos_buche_24h_n'] / r['muestra_buche_n'] * 100).where(r['muestra_buche_n'] > 0, 0)
+        filas = pd.DataFrame({'fecha_recepcion': r['fecha_recepcion'].astype(str), 'evaluador_granja': r['evaluador_granja'],
+                              'temp_ambiente_c': r['temp_ambiente_c'], 'hum_relativa_pct': r['hum_relativa_pct'].astype(int),
+                              'temp_cama_c': r['temp_cama_c'], 'buche_lleno_24h_pct': buche.round(2),
+                              'cv_temp_cloacal_pct': cv_temp.reindex(r.index).round(2), 'cv_peso_granja_pct': cv_peso.round(2),
+                              'puntuacion_final_granja': puntajes['puntuacion_final'].round(2)})
+    else:
+        # Paso 4: como el formulario, usa el peso de llegada a granja y el total de aves del lote
+        llegada = pd.Series({lote: contexto[lote]['peso_llegada'] for lote in r.index})
+        total_aves = pd.Series({lote: contexto[lote]['total_aves'] for lote in r.index})
+        mortalidad = r['mortalidad_acumulada_7d_n']
+        filas = pd.DataFrame({'fecha_eval_7d': r['fecha_eval_7d'].astype(str), 'peso_promedio_7d': peso_medio.round(2),
+                              'cv_peso_7d_pct': cv_peso.round(2),
+                              'gdp_gr_dia': ((peso_medio - llegada) / 7).where(llegada > 0, 0).round(2),
+                              'factor_crecimiento': (peso_medio / llegada).where(llegada > 0, 0).round(2),
+                              'mortalidad_acumulada_7d_n': mortalidad.astype(int),
+                              'mortalidad_acumulada_7d_pct': (mortalidad / total_aves * 100).where(total_aves > 0, 0).round(2)})
+    detalle_por_lote = _filas_detalle(detalle, columnas_detalle, id_col)
+    hoja_detalle = HOJAS[spec['clave_detalle']]
+    return {lote: [(hoja, [[lote, *fila]]), (hoja_detalle, detalle_por_lote[lote])]
+            for lote, fila in zip(filas.index, filas.values.tolist())}
+
+
+# --- Ingesta ---
+def ingerir(almacen, bandeja, paso, resumen, detalle=None, simular=False, tiempo_maximo=600, informar=print):
+    """Valida, calcula y escribe los lotes de `resumen`/`detalle` (DataFrames de texto).
+
+    Devuelve un DataFrame con una fila por lote: estado ('escrito', 'pendiente', 'válido'
+    si se simula, o 'error') y el motivo.
+    """
+    spec = PASOS[paso]
+    id_col = spec['id']
+    errores = {}
+    resumen = validar(resumen, spec['resumen'], id_col, errores)
+    repetidos = resumen[id_col][resumen[id_col].duplicated()]
+    for lote in repetidos.unique():
+        errores.setdefault(lote, []).append("lote repetido en el archivo de resumen")
+    resumen = resumen.drop_duplicates(id_col)
+    lotes = list(resumen[id_col])
+
+    if 'detalle' in spec:
+        if detalle is None:
+            raise ErrorArchivo(f"El Paso {paso} necesita un archivo de detalle")
+        detalle = validar(detalle, spec['detalle'], id_col, errores)
+        tamanos = detalle.groupby(id_col, sort=False).size()
+        for lote in lotes:
+            if tamanos.get(lote, 0) != MUESTRA:
+                errores.setdefault(lote, []).append(f"el detalle tiene {tamanos.get(lote, 0)} filas (se esperan {MUESTRA})")
+        for lote in tamanos.index.difference(lotes):
+            errores.setdefault(lote, []).append("hay detalle pero no resumen")
+
+    # Una sola lectura, solo de las hojas que el paso necesita: la suya (duplicados) y, en el
+    # Paso 4, el resumen de incubadora y el detalle de granja (datos de pasos anteriores)
+    claves = [spec['clave']] + (['lotes_resumen', 'granja_detalle'] if paso == 4 else [])
+    cache = CacheHojas(almacen, claves=claves)
+    cache.refrescar()
+    contexto = {}
+    for lote in lotes:
+        existentes = cache.buscar_lote(lote, claves, pendientes=bandeja.filas_pendientes, solo_indice=True)
+        if not existentes[spec['clave']].empty:
+            errores.setdefault(lote, []).append(f"ya registrado en {HOJAS[spec['clave']]}")
+        if paso == 4:
+            lote_info, granja = existentes['lotes_resumen'], existentes['granja_detalle']
+            if lote_info.empty:
+                errores.setdefault(lote, []).append("no existe en Lotes_Resumen (falta la evaluación de incubadora)")
+                continue
+            total_aves = pd.to_numeric(lote_info.iloc[0].get('cantidad_total', 0), errors='coerce')
+            contexto[lote] = {'peso_llegada': granja['peso_granja_gr'].mean() if not granja.empty else 0,
+                              'total_aves': total_aves if pd.notna(total_aves) else 0}
+
+    validos = [lote for lote in lotes if lote not in errores]
+    envios = construir_envios(paso, resumen[resumen[id_col].isin(validos)],
+                              detalle[detalle[id_col].isin(validos)] if detalle is not None else None,
+                              contexto) if validos else {}
+    reporte = {lote: ('error', "; ".join(msgs)) for lote, msgs in errores.items()}
+    if simular:
+        reporte.update({lote: ('válido', '') for lote in envios})
+        return _reporte(reporte, id_col)
+
+    claves_envio = {bandeja.encolar(operaciones): lote for lote, operaciones in envios.items()}
+    informar(f"{len(claves_envio)} lote(s) encolados; escribiendo por tandas de hasta {bandeja.max_envios_por_llamada}...")
+    limite = time.monotonic() + tiempo_maximo
+    while time.monotonic() < limite:
+        espera = bandeja.vaciar()
+        if espera is None or not set(claves_envio) & set(bandeja.claves_pendientes()):
+            break
+        time.sleep(min(espera, max(limite - time.monotonic(), 0)))
+    pendientes, detenidos = bandeja.claves_pendientes(), bandeja.detenidos()
+    for clave, lote in claves_envio.items():
+        if clave in detenidos:
+            reporte[lote] = ('error', f"rechazado al escribir ({detenidos[clave]}); detenido en la bandeja de salida")
+        elif clave in pendientes:
+            reporte[lote] = ('pendiente', f"sigue en la bandeja de salida ({pendientes[clave] or 'sin error'}); se reintentará")
+        else:
+            reporte[lote] = ('escrito', '')
+    return _reporte(reporte, id_col)
+
+
+def _reporte(reporte, id_col):
+    return pd.DataFrame([(lote, estado, motivo) for lote, (estado, motivo) in reporte.items()],
+                        columns=[id_col, 'estado', 'motivo']).sort_values(['estado', id_col], ignore_index=True)
+
+
+def conectar(ruta_secrets):
+    """Abre BD_Calidad_Pollito con las mismas credenciales y el mismo [almacen] que la app (.streamlit/secrets.toml).
+
+    Con tipo = "sheets" lee directo de Sheets; si no, a través de la réplica local de la app,
+    que solo trae las filas nuevas desde la última sincronización.
+    """
+    import gspread
+    from google.oauth2.service_account import Credentials
+
+    with open(ruta_secrets, 'rb') as f:
+        secrets = tomllib.load(f)
+    scopes = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
+    credentials = Credentials.from_service_account_info(secrets["gcp_service_account"], scopes=scopes)
+    client = REGISTRO.instrumentar(gspread.authorize(credentials))
+    config = secrets.get("almacen", {})
+    almacen = AlmacenSheets(abrir_hoja_calculo(client, config))
+    if config.get("tipo") == "sheets":
+        return almacen, config
+    return AlmacenEspejo(almacen, config.get("ruta_espejo", "espejo_pollito.sqlite")), config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingesta masiva de evaluaciones (Paso 0 a Paso 4) desde CSV o Excel")
+    parser.add_argument("--paso", type=int, choices=sorted(PASOS), required=True)
+    parser.add_argument("--resumen", required=True, help="una fila por lote (CSV, o Excel con 'archivo.xlsx#Hoja')")
+    parser.add_argument("--detalle", help="una fila por pollito/huevo, 30 por lote (pasos 0, 1, 3 y 4)")
+    parser.add_argument("--secrets", default=os.path.join(".streamlit", "secrets.toml"))
+    parser.add_argument("--bandeja", help="SQLite de la bandeja de salida (por defecto la de la app)")
+    parser.add_argument("--lotes-por-llamada", type=int, default=20, help="lotes por cada escritura a Sheets")
+    parser.add_argument("--tiempo-maximo", type=float, default=600, help="segundos máximos esperando la escritura")
+    parser.add_argument("--simular", action="store_true", help="solo valida y calcula, no escribe")
+    parser.add_argument("--reporte", help="CSV donde guardar el resultado por lote")
+    args = parser.parse_args()
+
+    try:
+        resumen = leer_tabla(args.resumen)
+        detalle = leer_tabla(args.detalle) if args.detalle else None
+        almacen, config = conectar(args.secrets)
+        bandeja = BandejaSalida(almacen, args.bandeja or config.get("ruta_bandeja", "bandeja_pollito.sqlite"),
+                                max_envios_por_llamada=args.lotes_por_llamada)
+        inicio = time.perf_counter()
+        reporte = ingerir(almacen, bandeja, args.paso, resumen, detalle, args.simular, args.tiempo_maximo)
+    except (ErrorArchivo, OSError) as e:
+        sys.exit(f"Error: {e}")
+    print(reporte.to_string(index=False))
+    print(f"\n{reporte['estado'].value_counts().to_dict()} en {time.perf_counter() - inicio:.1f} s")
+    if args.reporte:
+        reporte.to_csv(args.reporte, index=False)
+    sys.exit(1 if (reporte['estado'] == 'error').any() else 0)
+
+
+if __name__ == "__main__":
+    main()
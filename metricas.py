@@ -0,0 +1,141 @@
+# Métricas de los caminos calientes: llamadas a la API de Sheets, caché y render de pestañas.
+#
+# REGISTRO es compartido por todo el proceso (como un logger): los módulos miden con
+# `REGISTRO.medir(tipo, nombre)` y el panel de rendimiento de la app lo consulta.
+# Cada evento se emite además como una línea JSON en el logger "metricas" (nivel DEBUG)
+# y puede descargarse como JSONL desde el panel.
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Cuota de la API de Sheets por usuario de servicio: solicitudes por minuto de lectura y de escritura
+CUOTA_POR_MINUTO = {'lectura': 60, 'escritura': 60}
+
+
+def _operacion(url):
+    # .../v4/spreadsheets/<id>/values:batchGet -> 'values:batchGet'; .../spreadsheets/<id> -> 'metadatos'
+    ruta = urlparse(url).path
+    if '/spreadsheets/' in ruta:
+        resto = ruta.split('/spreadsheets/', 1)[1]
+        _, _, operacion = resto.partition('/')
+        if not operacion and ':' in resto:
+            operacion = resto[resto.index(':'):]
+        base, _, sufijo = operacion.partition('/')
+        if sufijo and ':' in sufijo:  # values/<rango>:append -> 'values:append'
+            base += sufijo[sufijo.rindex(':'):]
+        return base or 'metadatos'
+    return ruta.rstrip('/').rsplit('/', 1)[-1] or ruta
+
+
+class Metricas:
+    def __init__(self, max_eventos=5000):
+        self.eventos = deque(maxlen=max_eventos)
+        self._totales = {}
+        self._cuota = deque()  # (instante, 'lectura' | 'escritura') de cada solicitud HTTP a Google
+        self._lock = threading.Lock()
+        self._actual = threading.local()
+
+    def registrar(self, tipo, nombre, duracion_ms=0.0, **campos):
+        evento = {'ts': time.time(), 'tipo': tipo, 'nombre': nombre, 'duracion_ms': round(duracion_ms, 3), **campos}
+        with self._lock:
+            self.eventos.append(evento)
+            total = self._totales.setdefault((tipo, nombre), {'n': 0, 'ms': 0.0, 'errores': 0, 'filas': 0, 'bytes': 0})
+            total['n'] += 1
+            total['ms'] += duracion_ms
+            total['errores'] += 'error' in campos
+            total['filas'] += campos.get('filas') or 0
+            total['bytes'] += campos.get('bytes') or 0
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps(evento, default=str, ensure_ascii=False))
+        return evento
+
+    @contextmanager
+    def medir(self, tipo, nombre, **campos):
+        """Mide el bloque; se pueden completar campos (filas, bytes…) en el dict que devuelve.
+
+        Las solicitudes HTTP hechas dentro del bloque suman sus bytes y su cuota a este evento.
+        """
+        anterior = getattr(self._actual, 'evento', None)
+        self._actual.evento = campos
+        inicio = time.perf_counter()
+        try:
+            yield campos
+        except Exception as e:
+            campos['error'] = type(e).__name__
+            raise
+        finally:
+            self._actual.evento = anterior
+            self.registrar(tipo, nombre, (time.perf_counter() - inicio) * 1000, **campos)
+
+    def respuesta_http(self, respuesta, *args, **kwargs):
+        """Hook de `requests` para la sesión de gspread: una entrada por solicitud a la API de Google."""
+        tipo_cuota = 'lectura' if respuesta.request.method == 'GET' else 'escritura'
+        tamano = len(respuesta.content or b'')
+        with self._lock:
+            self._cuota.append((time.monotonic(), tipo_cuota))
+        campos = {'metodo': respuesta.request.method, 'estado': respuesta.status_code, 'bytes': tamano,
+                  'cuota': tipo_cuota}
+        if not respuesta.ok:
+            campos['error'] = f"HTTP {respuesta.status_code}"
+        self.registrar('http', _operacion(respuesta.url), respuesta.elapsed.total_seconds() * 1000, **campos)
+        actual = getattr(self._actual, 'evento', None)
+        if actual is not None:
+            actual['bytes'] = actual.get('bytes', 0) + tamano
+            actual['solicitudes'] = actual.get('solicitudes', 0) + 1
+
+    def instrumentar(self, cliente):
+        """Engancha el hook HTTP a un cliente de gspread (una sola vez)."""
+        ganchos = cliente.http_client.session.hooks.setdefault('response', [])
+        if self.respuesta_http not in ganchos:
+            ganchos.append(self.respuesta_http)
+        return cliente
+
+    # --- Consultas para el panel ---
+    def cuota_ultimo_minuto(self):
+        limite = time.monotonic() - 60
+        with self._lock:
+            while self._cuota and self._cuota[0][0] < limite:
+                self._cuota.popleft()
+            usadas = [t for _, t in self._cuota]
+        return {tipo: usadas.count(tipo) for tipo in CUOTA_POR_MINUTO}
+
+    def aciertos_cache(self):
+        with self._lock:
+            return {nombre: total['n'] for (tipo, nombre), total in self._totales.items() if tipo == 'cache'}
+
+    def resumen(self):
+        """Totales acumulados por (tipo, nombre) y percentiles de los eventos recientes."""
+        with self._lock:
+            totales = {clave: dict(valor) for clave, valor in self._totales.items()}
+            recientes = pd.DataFrame(list(self.eventos))
+        if not totales:
+            return pd.DataFrame()
+        tabla = pd.DataFrame.from_dict(totales, orient='index')
+        tabla.index.names = ['tipo', 'nombre']
+        tabla['ms_promedio'] = tabla['ms'] / tabla['n']
+        if not recientes.empty:
+            grupos = recientes.groupby(['tipo', 'nombre'])['duracion_ms']
+            tabla['ms_p95'] = grupos.quantile(0.95)
+            tabla['ms_max'] = grupos.max()
+        return tabla.drop(columns='ms').round(1).sort_values('n', ascending=False)
+
+    def a_jsonl(self):
+        with self._lock:
+            eventos = list(self.eventos)
+        return "\n".join(json.dumps(e, default=str, ensure_ascii=False) for e in eventos) + "\n"
+
+    def reiniciar(self):
+        with self._lock:
+            self.eventos.clear()
+            self._totales.clear()
+
+
+REGISTRO = Metricas()
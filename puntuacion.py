@@ -0,0 +1,96 @@
+# Método Rodriguez: puntuación de la muestra de pollitos.
+#
+# calcular_puntuacion evalúa la muestra de un solo lote (formularios de la app).
+# puntuar_lotes aplica exactamente las mismas reglas a muchos lotes a la vez, con
+# operaciones de NumPy sobre toda la tabla de detalle agrupada por lote_id.
+import numpy as np
+import pandas as pd
+
+PUNTUACIONES = {'vitalidad_ok': 15, 'ombligo_ok': 15, 'patas_ok': 9.5, 'ojos_ok': 9.5, 'pico_ok': 7.125, 'abdomen_ok': 7.125, 'plumon_ok': 7.125, 'cuello_ok': 7.125}
+COLUMNAS_PESO = ['peso_gr', 'peso_granja_gr', 'peso_7d_gr']
+PESO_MINIMO_GR = 34
+BONO_PESO = 9.5
+UNIFORMIDAD_MINIMA = 82
+BONO_UNIFORMIDAD = 13
+
+
+def calcular_puntuacion(df, sample_size, puntuaciones=PUNTUACIONES):
+    peso_col = next((col for col in COLUMNAS_PESO if col in df.columns), None)
+    if not peso_col: return 0, 0
+
+    for col in puntuaciones.keys():
+        if col in df.columns:
+            df[col] = df[col].apply(lambda x: str(x).strip().upper() == 'TRUE')
+
+    df['puntuacion_individual'] = sum(df[param] * (score / sample_size) for param, score in puntuaciones.items() if param in df.columns)
+    df['puntuacion_individual'] += np.where(df[peso_col] >= PESO_MINIMO_GR, BONO_PESO / sample_size, 0)
+    puntuacion_final = df['puntuacion_individual'].sum()
+
+    peso_promedio = df[peso_col].mean()
+    uniformidad = (df[peso_col].between(peso_promedio * 0.9, peso_promedio * 1.1).sum() / sample_size) * 100
+    if uniformidad >= UNIFORMIDAD_MINIMA:
+        puntuacion_final += BONO_UNIFORMIDAD
+    return puntuacion_final, uniformidad
+
+
+def a_booleano(serie):
+    # Misma regla que calcular_puntuacion: solo 'TRUE' (sin importar mayúsculas/espacios) es verdadero
+    if pd.api.types.is_bool_dtype(serie):
+        return serie.to_numpy(dtype=bool)
+    return serie.astype(str).str.strip().str.upper().eq('TRUE').to_numpy(dtype=bool)
+
+
+def _sumas_por_grupo(valores, inicios, tamanos):
+    # Suma cada tramo contiguo con la misma reducción de NumPy que Series.sum sobre un lote
+    # aislado, agrupando los lotes por tamaño para que el orden de suma sea idéntico
+    sumas = np.zeros(len(inicios))
+    for tam in np.unique(tamanos):
+        sel = np.flatnonzero(tamanos == tam)
+        sumas[sel] = valores[inicios[sel, None] + np.arange(tam)].sum(axis=1)
+    return sumas
+
+
+def puntuar_lotes(df, sample_size=30, puntuaciones=PUNTUACIONES, id_col='lote_id'):
+    """Puntúa todos los lotes de una tabla de detalle en una sola pasada.
+
+    Devuelve un DataFrame indexado por lote con `puntuacion_final`, `uniformidad` y
+    `n_pollitos`; los valores coinciden con calcular_puntuacion aplicado a cada lote.
+    Las filas sin lote se descartan: no pertenecen a ninguna muestra.
+    """
+    df = df[df[id_col].notna()]
+    codigos, lotes = pd.factorize(df[id_col], sort=False)
+    orden = np.argsort(codigos, kind='stable')
+    tamanos = np.bincount(codigos, minlength=len(lotes))
+    inicios = np.cumsum(tamanos) - tamanos
+    peso_col = next((col for col in COLUMNAS_PESO if col in df.columns), None)
+    if not peso_col or not len(lotes):
+        return pd.DataFrame({'puntuacion_final': 0.0, 'uniformidad': 0.0, 'n_pollitos': tamanos},
+                            index=pd.Index(lotes, name=id_col))
+
+    # Matriz booleana (pollitos x parámetros) y vector de pesos del método
+    params = [param for param in puntuaciones if param in df.columns]
+    matriz = np.column_stack([a_booleano(df[param]) for param in params]) if params else np.zeros((len(df), 0), dtype=bool)
+    vector = np.array([puntuaciones[param] / sample_size for param in params])
+
+    # Se acumula columna a columna (no con matmul) para conservar el orden de suma de calcular_puntuacion
+    individual = np.zeros(len(df))
+    for j in range(len(params)):
+        individual = individual + matriz[:, j] * vector[j]
+    peso = pd.to_numeric(df[peso_col], errors='coerce').to_numpy(dtype=float)
+    individual = individual + np.where(peso >= PESO_MINIMO_GR, BONO_PESO / sample_size, 0)
+
+    puntuacion = _sumas_por_grupo(individual[orden], inicios, tamanos)
+
+    # Peso promedio por lote ignorando faltantes, como Series.mean
+    peso_ord = peso[orden]
+    validos = ~np.isnan(peso_ord)
+    n_validos = np.add.reduceat(validos.astype(int), inicios)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        promedio = _sumas_por_grupo(np.where(validos, peso_ord, 0.0), inicios, tamanos) / n_validos
+    promedio_fila = np.repeat(promedio, tamanos)
+    en_rango = (peso_ord >= promedio_fila * 0.9) & (peso_ord <= promedio_fila * 1.1)
+    uniformidad = np.add.reduceat(en_rango.astype(int), inicios) / sample_size * 100
+
+    puntuacion = puntuacion + np.where(uniformidad >= UNIFORMIDAD_MINIMA, BONO_UNIFORMIDAD, 0)
+    return pd.DataFrame({'puntuacion_final': puntuacion, 'uniformidad': uniformidad, 'n_pollitos': tamanos},
+                        index=pd.Index(lotes, name=id_col))
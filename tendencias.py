@@ -0,0 +1,95 @@
+# Cubo de tendencias entre lotes: semana x granja de origen x línea genética x edad de reproductoras.
+#
+# Cada celda guarda sumas y conteos (medidas aditivas), así que el cubo se mantiene de forma
+# incremental: cuando llegan filas de algunos lotes se resta su aporte anterior y se suma el
+# nuevo, sin recalcular el resto del histórico.
+import numpy as np
+import pandas as pd
+
+DIMENSIONES = ['semana', 'granja_origen', 'linea_genetica', 'rango_edad']
+# Columna de agregados por lote -> nombre de la medida
+MEDIDAS = {
+    'puntuacion_final': 'calidad_incubadora',
+    'puntuacion_final_granja': 'calidad_granja',
+    'cv_peso': 'cv_peso_incubadora_pct',
+    'mortalidad_acumulada_7d_pct': 'mortalidad_7d_pct',
+}
+RANGOS_EDAD = [(0, 30, '<30 sem'), (30, 40, '30-39 sem'), (40, 50, '40-49 sem'), (50, np.inf, '≥50 sem')]
+SIN_DATO = 'Sin dato'
+
+
+def _hechos(agregados):
+    """Una fila por lote con sus dimensiones y medidas; los lotes sin fecha de nacimiento quedan fuera."""
+    if agregados.empty or 'fecha_nacimiento' not in agregados.columns:
+        return pd.DataFrame(columns=DIMENSIONES + list(MEDIDAS.values()))
+    hechos = pd.DataFrame(index=agregados.index)
+    fechas = pd.to_datetime(agregados['fecha_nacimiento'], errors='coerce')
+    hechos['semana'] = fechas.dt.to_period('W-SUN').dt.start_time
+    for col in ['granja_origen', 'linea_genetica']:
+        hechos[col] = agregados[col].astype(object).where(agregados[col].notna(), SIN_DATO).astype(str)
+    edad = pd.to_numeric(agregados.get('edad_reproductoras'), errors='coerce').astype(float)
+    cortes = [r[0] for r in RANGOS_EDAD] + [RANGOS_EDAD[-1][1]]
+    rango = pd.cut(edad, cortes, right=False, labels=[r[2] for r in RANGOS_EDAD])
+    hechos['rango_edad'] = rango.astype(object).where(rango.notna(), SIN_DATO).astype(str)
+    for col, medida in MEDIDAS.items():
+        hechos[medida] = pd.to_numeric(agregados[col], errors='coerce').astype(float)
+    return hechos[hechos['semana'].notna()]
+
+
+def _rollup(hechos):
+    if hechos.empty:
+        return pd.DataFrame()
+    grupos = hechos.groupby(DIMENSIONES, observed=True)
+    partes = {'n_lotes': grupos.size()}
+    for medida in MEDIDAS.values():
+        partes[f'suma_{medida}'] = grupos[medida].sum()
+        partes[f'n_{medida}'] = grupos[medida].count()
+    return pd.DataFrame(partes).astype(float)
+
+
+def _sumar(a, b):
+    if b.empty:
+        return a
+    if a.empty:
+        return b
+    return a.add(b, fill_value=0)
+
+
+class CuboTendencias:
+    def __init__(self):
+        self.hechos = _hechos(pd.DataFrame())
+        self.tabla = pd.DataFrame()
+
+    def actualizar(self, agregados, lotes=None):
+        """Aplica los cambios de `lotes` (None = reconstruir desde todos los agregados)."""
+        if lotes is None:
+            self.hechos = _hechos(agregados)
+            self.tabla = _rollup(self.hechos)
+            return self.tabla
+        lotes = pd.Index(sorted(lotes))
+        nuevos = _hechos(agregados.loc[agregados.index.intersection(lotes)])
+        anteriores = self.hechos.loc[self.hechos.index.intersection(lotes)]
+        tabla = _sumar(_sumar(self.tabla, _rollup(nuevos)), -_rollup(anteriores))
+        self.tabla = tabla[tabla['n_lotes'] > 0] if not tabla.empty else tabla
+        self.hechos = pd.concat([self.hechos.drop(anteriores.index), nuevos])
+        return self.tabla
+
+
+def tendencia(tabla, dimension=None, filtros=None):
+    """Promedio semanal de cada medida, opcionalmente desglosado por una dimensión.
+
+    `filtros` es {dimension: [valores]} y se aplica antes de agrupar.
+    """
+    if tabla.empty:
+        return pd.DataFrame()
+    datos = tabla.reset_index()
+    for dim, valores in (filtros or {}).items():
+        if valores:
+            datos = datos[datos[dim].isin(valores)]
+    claves = ['semana'] + ([dimension] if dimension else [])
+    sumas = datos.groupby(claves).sum(numeric_only=True)
+    resultado = pd.DataFrame({'n_lotes': sumas['n_lotes'].astype(int)})
+    for medida in MEDIDAS.values():
+        n = sumas[f'n_{medida}']
+        resultado[medida] = (sumas[f'suma_{medida}'] / n).where(n > 0)
+    return resultado.reset_index()
@@ -0,0 +1,66 @@
+import threading
+import time
+
+from almacenamiento import AlmacenEspejo, AlmacenMemoria
+
+
+class OrigenContado(AlmacenMemoria):
+    """Cuenta las solicitudes de lectura como lo haría la API: metadatos y lecturas de valores."""
+
+    def __init__(self, demora=0.0):
+        super().__init__()
+        self.solicitudes = []
+        self.demora = demora
+
+    def hojas_existentes(self):
+        self.solicitudes.append('meta')
+        return super().hojas_existentes()
+
+    def leer_desde(self, desde):
+        self.solicitudes.append(('get', len(desde)))
+        time.sleep(self.demora)
+        return super().leer_desde(desde)
+
+
+def _espejo(origen, tmp_path):
+    return AlmacenEspejo(origen, str(tmp_path / "espejo.sqlite"), intervalo_sync=0)
+
+
+def test_cada_sincronizacion_cuesta_una_sola_lectura(tmp_path):
+    origen = OrigenContado()
+    espejo = _espejo(origen, tmp_path)
+    espejo.sincronizar(forzar=True)
+    espejo.anexar_lote([("Huevo_Recepcion", [["L1", "G", 30]])])
+    origen.solicitudes.clear()
+    espejo.sincronizar(forzar=True)
+    espejo.filas_lote("Huevo_Recepcion", "L1")
+    assert origen.solicitudes == [('get', 8), ('get', 8)]
+    assert espejo.filas_lote("Huevo_Recepcion", "L1")[1] == [["L1", "G", "30"]]
+
+
+def test_tras_un_error_se_vuelven_a_listar_las_hojas(tmp_path):
+    origen = OrigenContado()
+    espejo = _espejo(origen, tmp_path)
+    espejo.sincronizar(forzar=True)
+    origen.leer_desde = lambda desde: (_ for _ in ()).throw(ConnectionError("sin red"))
+    assert espejo.sincronizar(forzar=True) is False
+    del origen.leer_desde
+    origen.solicitudes.clear()
+    assert espejo.sincronizar(forzar=True)
+    assert origen.solicitudes == ['meta', ('get', 8)]
+
+
+def test_las_lecturas_locales_no_esperan_a_una_sincronizacion_en_curso(tmp_path):
+    origen = OrigenContado()
+    espejo = _espejo(origen, tmp_path)
+    espejo.anexar_lote([("Huevo_Recepcion", [["L1", "G", 30]])])
+    espejo.sincronizar(forzar=True)
+    origen.demora = 1.0
+    hilo = threading.Thread(target=espejo.sincronizar, kwargs={'forzar': True})
+    hilo.start()
+    time.sleep(0.1)
+    inicio = time.monotonic()
+    _, filas = espejo.filas_lote("Huevo_Recepcion", "L1")
+    assert time.monotonic() - inicio < 0.5
+    assert len(filas) == 1
+    hilo.join()
@@ -0,0 +1,152 @@
+import threading
+import time
+
+import pytest
+import requests
+from google.auth.exceptions import RefreshError, TransportError
+
+from almacenamiento import AlmacenMemoria
+from bandeja_salida import BandejaSalida
+
+OPERACIONES = [("Huevo_Recepcion", [["L1", "Granja 01", 30]])]
+
+
+class _Respuesta:
+    def __init__(self, codigo):
+        self.status_code = codigo
+
+
+class ErrorHTTP(Exception):
+    def __init__(self, codigo):
+        super().__init__(f"HTTP {codigo}")
+        self.response = _Respuesta(codigo)
+
+
+class AlmacenFallido(AlmacenMemoria):
+    """Falla con `error` en cada escritura; con `escribe` la aplica antes de fallar (respuesta perdida)."""
+
+    def __init__(self, error=None, escribe=False):
+        super().__init__()
+        self.error, self.escribe = error, escribe
+
+    def anexar_lote(self, operaciones):
+        if self.escribe or self.error is None:
+            super().anexar_lote(operaciones)
+        if self.error is not None:
+            raise self.error
+
+
+def _bandeja(almacen, **opciones):
+    return BandejaSalida(almacen, ':memory:', espera_base=0.0, **opciones)
+
+
+def _vaciar(bandeja, veces=6):
+    for _ in range(veces):
+        bandeja._pausa_hasta = 0.0
+        bandeja.vaciar()
+
+
+def _estado(bandeja):
+    return bandeja._conn.execute("SELECT intentos, incierto, detenido FROM envios").fetchone()
+
+
+def test_reenvio_tras_escribir_se_ignora():
+    almacen = AlmacenMemoria()
+    bandeja = _bandeja(almacen)
+    clave = bandeja.encolar(OPERACIONES)
+    assert bandeja.vaciar() is None
+    assert bandeja.encolar(OPERACIONES) == clave
+    assert bandeja.pendientes() == 0
+    bandeja.vaciar()
+    assert len(almacen.hojas["Huevo_Recepcion"]) == 2  # encabezado + una fila
+
+
+def test_claves_enviadas_se_olvidan_tras_la_retencion():
+    bandeja = _bandeja(AlmacenMemoria(), retencion_enviados=-1)
+    bandeja.encolar(OPERACIONES)
+    bandeja.vaciar()
+    assert bandeja._conn.execute("SELECT COUNT(*) FROM envios").fetchone()[0] == 0
+
+
+@pytest.mark.parametrize("error", [ErrorHTTP(400), ErrorHTTP(403), ValueError("fila inválida"),
+                                   RefreshError("invalid_grant: cuenta deshabilitada")])
+def test_errores_permanentes_se_detienen(error):
+    bandeja = _bandeja(AlmacenFallido(error), max_intentos=3)
+    clave = bandeja.encolar(OPERACIONES)
+    _vaciar(bandeja)
+    assert _estado(bandeja) == (3, 0, 1)
+    assert bandeja.pendientes() == 0
+    assert clave in bandeja.detenidos()
+
+
+@pytest.mark.parametrize("error", [ErrorHTTP(429), ErrorHTTP(500), ErrorHTTP(503)])
+def test_errores_transitorios_no_se_detienen(error):
+    bandeja = _bandeja(AlmacenFallido(error), max_intentos=3)
+    bandeja.encolar(OPERACIONES)
+    _vaciar(bandeja)
+    intentos, incierto, detenido = _estado(bandeja)
+    assert intentos == 6 and not incierto and not detenido
+    assert bandeja.pendientes() == 1
+
+
+@pytest.mark.parametrize("error", [TransportError(requests.ConnectionError("sin red")),
+                                   RefreshError("server_error", retryable=True)])
+def test_fallo_al_renovar_el_token_es_transitorio_y_no_incierto(error):
+    # Sin red el token vence y la renovación falla antes de llegar a Sheets
+    bandeja = _bandeja(AlmacenFallido(error), max_intentos=3)
+    bandeja.encolar(OPERACIONES)
+    _vaciar(bandeja)
+    assert _estado(bandeja) == (6, 0, 0)
+    assert bandeja.pendientes() == 1 and bandeja.detenidos() == {}
+
+
+def test_corte_de_conexion_es_incierto_y_se_verifica_sin_duplicar():
+    almacen = AlmacenFallido(requests.ReadTimeout("timeout"), escribe=True)
+    bandeja = _bandeja(almacen)
+    bandeja.encolar(OPERACIONES)
+    bandeja.vaciar()
+    assert _estado(bandeja)[1] == 1
+    almacen.error = None
+    _vaciar(bandeja)
+    assert bandeja.pendientes() == 0
+    assert len(almacen.hojas["Huevo_Recepcion"]) == 2
+
+
+def test_reenviar_un_envio_detenido_lo_reactiva():
+    almacen = AlmacenFallido(ErrorHTTP(400))
+    bandeja = _bandeja(almacen, max_intentos=1)
+    bandeja.encolar(OPERACIONES)
+    bandeja.vaciar()
+    assert bandeja.detenidos()
+    almacen.error = None
+    bandeja.encolar(OPERACIONES)
+    bandeja.vaciar()
+    assert bandeja.detenidos() == {} and bandeja.pendientes() == 0
+    assert len(almacen.hojas["Huevo_Recepcion"]) == 2
+
+
+def test_dos_procesos_no_escriben_el_mismo_envio(tmp_path):
+    ruta = str(tmp_path / "bandeja.sqlite")
+    destino, escritos = AlmacenMemoria(), []
+
+    class Lento:
+        def anexar_lote(self, operaciones):
+            time.sleep(0.02)
+            escritos.extend(fila[0] for _, filas in operaciones for fila in filas)
+            destino.anexar_lote(operaciones)
+
+    bandejas = [BandejaSalida(Lento(), ruta, max_envios_por_llamada=5) for _ in range(2)]
+    for i in range(40):
+        bandejas[0].encolar([("Huevo_Recepcion", [[f"L{i}", "Granja 01", 30]])])
+
+    def correr(bandeja):
+        while bandeja.vaciar() is not None:
+            pass
+
+    hilos = [threading.Thread(target=correr, args=(b,)) for b in bandejas]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert sorted(escritos) == sorted(f"L{i}" for i in range(40))
+    assert bandejas[0].pendientes() == 0
@@ -0,0 +1,28 @@
+from almacenamiento import AlmacenMemoria
+from carga_datos import CacheHojas
+from esquema import HOJAS
+
+
+class AlmacenContado(AlmacenMemoria):
+    def __init__(self):
+        super().__init__()
+        self.leidas = set()
+
+    def leer_desde(self, desde):
+        self.leidas.update(desde)
+        return super().leer_desde(desde)
+
+
+def test_con_claves_solo_lee_esas_hojas():
+    almacen = AlmacenContado()
+    almacen.anexar(HOJAS['huevo_recepcion'], [["L1", "Granja 01", 30]])
+    cache = CacheHojas(almacen, claves=['lotes_resumen', 'granja_detalle'])
+    datos = cache.refrescar()
+    assert almacen.leidas == {HOJAS['lotes_resumen'], HOJAS['granja_detalle']}
+    assert datos.filas('huevo_recepcion', 'L1').empty
+
+
+def test_sin_claves_lee_las_ocho_hojas():
+    almacen = AlmacenContado()
+    CacheHojas(almacen).refrescar()
+    assert almacen.leidas == set(HOJAS.values())
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from puntuacion import PUNTUACIONES, calcular_puntuacion, puntuar_lotes
+
+VALORES_OK = [True, False, 'TRUE', 'false', ' true ', 'True', '', None]
+
+
+def _detalle(semilla, tamanos):
+    rng = np.random.default_rng(semilla)
+    partes = []
+    for i, tam in enumerate(tamanos):
+        lote = pd.DataFrame({'lote_id': f"L{i:02d}", 'peso_gr': rng.normal(38, 3, tam).round(1)})
+        lote.loc[rng.random(tam) < 0.1, 'peso_gr'] = np.nan
+        for param in PUNTUACIONES:
+            lote[param] = rng.choice(np.array(VALORES_OK, dtype=object), tam)
+        partes.append(lote)
+    # Lotes intercalados y barajados, como llegan al leer la hoja completa
+    return pd.concat(partes).sample(frac=1, random_state=semilla).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("semilla", [0, 1, 2])
+@pytest.mark.parametrize("muestra", [30, 25])
+def test_coincide_con_calcular_puntuacion_por_lote(semilla, muestra):
+    detalle = _detalle(semilla, [30, 12, 30, 1, 45, 30, 7])
+    resultado = puntuar_lotes(detalle, muestra)
+    assert list(resultado.index) == list(detalle['lote_id'].unique())
+    for lote_id, grupo in detalle.groupby('lote_id', sort=False):
+        puntuacion, uniformidad = calcular_puntuacion(grupo.copy(), muestra)
+        fila = resultado.loc[lote_id]
+        assert fila['puntuacion_final'] == pytest.approx(puntuacion, abs=1e-9)
+        assert fila['uniformidad'] == pytest.approx(uniformidad, abs=1e-9)
+        assert fila['n_pollitos'] == len(grupo)
+
+
+def test_texto_con_espacios_cuenta_como_verdadero():
+    detalle = pd.DataFrame({'lote_id': ['L1'] * 2, 'peso_gr': [30.0, 30.0], 'vitalidad_ok': [' true ', 'TRUE ']})
+    assert puntuar_lotes(detalle, 2).loc['L1', 'puntuacion_final'] == pytest.approx(15 + 13)
+
+
+def test_filas_sin_lote_se_descartan():
+    detalle = _detalle(3, [30, 20])
+    sin_lote = detalle.head(5).assign(lote_id=[None, np.nan, None, np.nan, None])
+    resultado = puntuar_lotes(pd.concat([sin_lote, detalle], ignore_index=True))
+    pd.testing.assert_frame_equal(resultado, puntuar_lotes(detalle), check_index_type=False)
+
+
+def test_solo_filas_sin_lote_devuelve_vacio():
+    detalle = pd.DataFrame({'lote_id': [None, np.nan], 'peso_gr': [40.0, 41.0]})
+    assert puntuar_lotes(detalle).empty